@@ -18,14 +18,120 @@ class Settings(BaseSettings):
     
     # Database
     database_url: str = "sqlite:///../data/ai_platform.db"
+    async_database_url: str | None = None  # Derived from database_url when unset
+    sqlite_profile: str = "production"  # 'production' or 'default' (SQLite's own settings)
+    sqlite_pragmas: dict[str, str | int] = {}  # Per-pragma overrides on top of the profile
     
     # Ollama
     ollama_base_url: str = "http://localhost:11434"
     ollama_timeout: int = 300  # 5 minutes for generation
+    ollama_connect_timeout: float = 10.0
+    ollama_list_timeout: int = 30
+    ollama_pull_timeout: int = 3600  # 1 hour for model downloads
+    ollama_max_connections: int = 100
+    ollama_max_keepalive_connections: int = 20
+    ollama_keepalive_expiry: float = 60.0  # seconds an idle connection is kept open
+    ollama_http2: bool = False  # requires httpx[http2]
+    ollama_json_decoder: str = "auto"  # auto, orjson, msgspec or json
+    ollama_coalesce_requests: bool = True  # share identical in-flight temperature 0 generations
+    
+    # Ollama load balancing (falls back to ollama_base_url when empty)
+    ollama_base_urls: list[str] = []
+    ollama_probe_interval: float = 15.0  # seconds between health probes, 0 disables
+    ollama_probe_timeout: float = 5.0
+    ollama_unhealthy_threshold: int = 2  # consecutive failures before ejection
+    ollama_cold_model_penalty: int = 2  # in-flight weight for nodes without the model loaded
+    ollama_affinity_max_entries: int = 10000  # conversations remembered for backend pinning
+    
+    # Generation scheduling
+    scheduler_max_concurrent_per_model: int = 2  # per healthy backend serving the model
+    scheduler_max_concurrent_per_backend: int = 4
+    scheduler_max_queue_per_project: int = 10
+    scheduler_max_queue_total: int = 100
+    scheduler_queue_timeout: float = 120.0  # seconds a request may wait for a slot
+    scheduler_default_retry_after: int = 5  # seconds, before any generation has finished
+    scheduler_max_background_per_model: int = 1  # slots batch work may hold per model
+    
+    # Context window management
+    context_window: int = 8192  # num_ctx requested from Ollama
+    context_min_history_tokens: int = 1024  # history budget floor when max_tokens is large
+    context_chars_per_token: float = 4.0
+    context_message_overhead_tokens: int = 4
+    context_summary_enabled: bool = True
+    context_keep_ratio: float = 0.6  # share of the budget kept verbatim after folding
+    context_summary_model: str | None = None  # defaults to the agent's model
+    context_summary_max_tokens: int = 512
+    
+    # Server-sent events
+    sse_coalesce_interval: float = 0.0  # seconds to gather tokens per frame, 0 sends as they arrive
+    sse_coalesce_bytes: int = 4096  # flush a frame once this much text is buffered
+    sse_heartbeat_interval: float = 15.0
+    sse_queue_size: int = 256  # tokens buffered ahead of a slow client
+    
+    # Write-behind message batching
+    write_behind_flush_interval: float = 0.02  # seconds to gather concurrent writes
+    write_behind_max_batch: int = 256
+    
+    # Response cache for temperature 0 agents (opt-in)
+    response_cache_enabled: bool = False
+    response_cache_path: Path = Path("../data/response_cache.db")
+    response_cache_max_bytes: int = 256 * 1024 * 1024  # 256MB
+    response_cache_ttl: int = 7 * 24 * 3600  # 7 days
+    
+    # Model residency: keep recently used models loaded in Ollama
+    model_keep_alive: str = "30m"  # Ollama keep_alive sent with every request
+    model_keep_alive_overrides: dict[str, str] = {}  # per-model keep_alive, e.g. {"llama3:70b": "5m"}
+    model_preload_interval: int = 60  # seconds between preload passes (0 disables)
+    model_preload_window: int = 3600  # projects accessed within this many seconds count as recent
+    model_preload_max: int = 1  # most models to keep warm per pass; at most Ollama's OLLAMA_MAX_LOADED_MODELS
+    model_preload_timeout: float = 300.0
+    
+    # Conversation history cache
+    history_cache_max_bytes: int = 64 * 1024 * 1024  # 64MB
+    
+    # Document ingestion (RAG)
+    embedding_model: str = "nomic-embed-text"
+    embedding_cache_path: Path = Path("../data/embedding_cache.db")
+    ingest_chunk_chars: int = 1500
+    ingest_chunk_overlap: int = 200
+    ingest_workers: int = 2  # processes for text extraction and chunking
+    ingest_concurrency: int = 2  # documents in flight at once
+    ingest_embed_batch_size: int = 32  # chunks per /api/embed call
+    ingest_embed_concurrency: int = 2  # concurrent /api/embed calls
+    
+    # Vector index and retrieval
+    vector_dir: Path = Path("../data/vectors")
+    vector_ivf_threshold: int = 20000  # live vectors before a project switches to IVF search
+    vector_ivf_lists: int = 0  # 0 picks sqrt(rows)
+    vector_ivf_nprobe: int = 8
+    vector_compact_ratio: float = 0.3  # rewrite files once this share of rows is deleted
+    rag_enabled: bool = True
+    rag_top_k: int = 4
+    rag_min_score: float = 0.3
+    rag_max_chars: int = 6000
+    rag_latency_budget: float = 0.3  # seconds; chat goes ahead without context past this
+    
+    # Model catalog
+    model_catalog_ttl: int = 60  # seconds before /api/tags is refreshed in the background
+    
+    # Model pulls
+    model_pull_max_concurrent: int = 1  # parallel downloads, leaves bandwidth for inference
+    model_pull_history: int = 50  # finished pull jobs kept for polling
+    
+    # Batch jobs
+    batch_dir: Path = Path("../data/batch")
+    batch_default_concurrency: int = 4
+    batch_max_concurrency: int = 16
+    batch_max_prompts: int = 10000
+    
+    # Message search
+    search_snippet_tokens: int = 16  # Tokens of context around matches in result snippets
     
     # File uploads
     max_upload_size: int = 100 * 1024 * 1024  # 100MB
-    upload_dir: Path = Path("./data/uploads")
+    upload_dir: Path = Path("../data/uploads")
+    upload_chunk_size: int = 1024 * 1024  # bytes per disk write and hash update
+    upload_session_ttl: int = 24 * 3600  # seconds an unfinished resumable upload is kept
     
     # CORS
     allowed_origins: list[str] = ["http://localhost:5173", "http://localhost:3000"]
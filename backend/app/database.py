@@ -1,17 +1,110 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Float
+from sqlalchemy import create_engine, event, Column, Integer, String, Text, DateTime, ForeignKey, Float, Index, Boolean
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import Session, sessionmaker, relationship
 from datetime import datetime
+import logging
+import time
+from app import metrics
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
+# SQLite storage profiles, applied to every new connection
+SQLITE_PROFILES = {
+    "default": {},
+    "production": {
+        "journal_mode": "WAL",  # Readers no longer block the writer
+        "synchronous": "NORMAL",  # Durable with WAL, far fewer fsyncs than FULL
+        "busy_timeout": 5000,  # ms to wait on a locked database before erroring
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # Negative means KiB, so 64MB of page cache
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def sqlite_pragmas() -> dict:
+    """Pragmas for the configured profile, with overrides applied."""
+    if settings.sqlite_profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLite profile: {settings.sqlite_profile}")
+    return {**SQLITE_PROFILES[settings.sqlite_profile], **settings.sqlite_pragmas}
+
+
+def async_database_url() -> str:
+    """Async driver URL for the configured database."""
+    if settings.async_database_url:
+        return settings.async_database_url
+    if settings.database_url.startswith("sqlite:"):
+        return settings.database_url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    return settings.database_url
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in sqlite_pragmas().items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
 # Create engine
 engine = create_engine(
     settings.database_url,
     connect_args={"check_same_thread": False}  # Needed for SQLite
 )
 
-# Session factory
+# Async engine for request paths that must not block the event loop
+async_engine = create_async_engine(async_database_url())
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+
+
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    metrics.db_query_seconds.observe(elapsed, statement.lstrip()[:16].split(None, 1)[0].upper())
+
+
+def _query_failed(context):
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+# Statement timings for /metrics, on both engines (first keyword as the label)
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _query_started)
+    event.listen(_engine, "after_cursor_execute", _query_finished)
+    event.listen(_engine, "handle_error", _query_failed)
+
+
+def _commit_started(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+def _commit_finished(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        metrics.db_commit_seconds.observe(time.perf_counter() - started)
+
+
+def _commit_failed(session, previous_transaction):
+    session.info.pop("commit_started", None)
+
+
+# Commit timings for /metrics; AsyncSession runs on a sync Session, so this covers both engines
+event.listen(Session, "before_commit", _commit_started)
+event.listen(Session, "after_commit", _commit_finished)
+event.listen(Session, "after_soft_rollback", _commit_failed)
+
+# Session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # Base class for models
 Base = declarative_base()
@@ -33,6 +126,7 @@ class Project(Base):
     
     # Relationships
     conversations = relationship("Conversation", back_populates="project", cascade="all, delete-orphan")
+    documents = relationship("Document", back_populates="project", cascade="all, delete-orphan")
 
 
 class Agent(Base):
@@ -56,37 +150,135 @@ class Agent(Base):
 class Conversation(Base):
     """Conversation history model."""
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index("ix_conversations_project_updated", "project_id", "updated_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
     agent_id = Column(Integer, ForeignKey("agents.id"), nullable=False)
+    summary = Column(Text, nullable=True)  # Rolling summary of turns trimmed from the context
+    summary_message_id = Column(Integer, nullable=True)  # Last message folded into summary
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     project = relationship("Project", back_populates="conversations")
     agent = relationship("Agent", back_populates="conversations")
-    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
+    messages = relationship(
+        "Message",
+        back_populates="conversation",
+        cascade="all, delete-orphan",
+        order_by="Message.created_at",
+    )
 
 
 class Message(Base):
     """Individual message model."""
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_conversation_created", "conversation_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     role = Column(String, nullable=False)  # 'user' or 'assistant'
     content = Column(Text, nullable=False)
+    truncated = Column(Boolean, default=False)  # Generation stopped early (client disconnected)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
 
 
+class Document(Base):
+    """File uploaded to a project; the bytes live in the content-addressed blob store."""
+    __tablename__ = "documents"
+    __table_args__ = (
+        Index("ix_documents_project_sha256", "project_id", "sha256"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    filename = Column(String, nullable=False)
+    content_type = Column(String, nullable=True)
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=False, index=True)
+    ingest_status = Column(String, default="pending")  # pending, processing, ready, failed
+    ingest_key = Column(String(64), nullable=True)  # Blob + pipeline settings of the last ingestion
+    ingest_error = Column(Text, nullable=True)
+    chunk_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    project = relationship("Project", back_populates="documents")
+    chunks = relationship(
+        "DocumentChunk",
+        back_populates="document",
+        cascade="all, delete-orphan",
+        order_by="DocumentChunk.chunk_index",
+    )
+
+
+class DocumentChunk(Base):
+    """Overlapping text chunk of a document; its embedding is cached by content_hash."""
+    __tablename__ = "document_chunks"
+    __table_args__ = (
+        Index("ix_document_chunks_document_index", "document_id", "chunk_index"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    
+    # Relationships
+    document = relationship("Document", back_populates="chunks")
+
+
+# Full-text index over message content (SQLite FTS5). It is an external
+# content table: only the index is stored, and triggers keep it in step with
+# every insert, edit and delete on messages, whichever code path makes them.
+MESSAGE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+]
+
+# Re-index every existing message (backfill)
+MESSAGE_SEARCH_REBUILD = "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"
+
+
+def init_message_search() -> None:
+    """Create the message search index, backfilling it when it is new."""
+    if engine.dialect.name != "sqlite":
+        return
+    try:
+        with engine.begin() as conn:
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+            ).first()
+            for statement in MESSAGE_SEARCH_DDL:
+                conn.exec_driver_sql(statement)
+            if not exists:
+                conn.exec_driver_sql(MESSAGE_SEARCH_REBUILD)
+    except Exception as e:
+        # SQLite builds without FTS5: everything but search keeps working
+        logger.warning("Message search unavailable: %s", e)
+
+
 # Database initialization
 def init_db():
     """Create all tables."""
     Base.metadata.create_all(bind=engine)
+    init_message_search()
 
 
 def get_db():
@@ -96,3 +288,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Dependency for getting an async database session."""
+    async with AsyncSessionLocal() as db:
+        yield db
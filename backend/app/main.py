@@ -1,12 +1,54 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from app import metrics
 from app.config import settings
-from app.database import init_db
-from app.routers import projects, agents, chat
+from app.database import init_db, async_engine
+from app.routers import projects, agents, chat, batch, models, documents
+from app.services.ollama import ollama_service
+from app.services.scheduler import generation_scheduler
+from app.services.writer import message_writer
+from app.services.history import history_cache
+from app.services.response_cache import response_cache
+from app.services.residency import residency_manager
+from app.services.batch import batch_runner
+from app.services.pulls import pull_manager
+from app.services.catalog import model_catalog
+from app.services.ingestion import ingestion_pipeline
+from app.services.embeddings import embedding_cache
+from app.services.retrieval import retriever
+from app.services.context import context_manager
+from app.services.vectors import vector_store
 
 # Initialize database
 init_db()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup and release them on shutdown."""
+    await ollama_service.startup()
+    await message_writer.start()
+    await residency_manager.start()
+    await batch_runner.start()
+    await model_catalog.start()
+    await ingestion_pipeline.start()
+    try:
+        yield
+    finally:
+        await batch_runner.stop()
+        await context_manager.stop()
+        await pull_manager.stop()
+        await model_catalog.stop()
+        await ingestion_pipeline.stop()
+        await residency_manager.stop()
+        await message_writer.stop()
+        await ollama_service.shutdown()
+        await async_engine.dispose()
+        response_cache.close()
+        embedding_cache.close()
+
+
 # Create FastAPI app
 app = FastAPI(
     title=settings.app_name,
@@ -16,6 +58,7 @@ app = FastAPI(
         "name": settings.contact_name,
         "email": "dougrichards13@gmail.com",
     },
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -27,10 +70,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency for /metrics
+app.add_middleware(metrics.RequestMetricsMiddleware, histogram=metrics.http_request_seconds)
+
 # Include routers
 app.include_router(projects.router)
 app.include_router(agents.router)
 app.include_router(chat.router)
+app.include_router(batch.router)
+app.include_router(models.router)
+app.include_router(documents.router)
 
 
 @app.get("/")
@@ -53,6 +102,93 @@ def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/health/backends")
+def backend_health():
+    """Health and load of each Ollama backend."""
+    return ollama_service.backend_status()
+
+
+@app.get("/health/generations")
+def generation_health():
+    """Coalesced and cancelled generation counters."""
+    return ollama_service.generation_stats()
+
+
+@app.get("/health/scheduler")
+def scheduler_health():
+    """Active and queued generations."""
+    return generation_scheduler.stats()
+
+
+@app.get("/health/history")
+def history_cache_health():
+    """Conversation history cache size and hit/miss counters."""
+    return history_cache.stats()
+
+
+@app.get("/health/writer")
+def message_writer_health():
+    """Queued messages and group-commit counters."""
+    return message_writer.stats()
+
+
+@app.get("/health/response-cache")
+def response_cache_health():
+    """Response cache hit/miss counters and size."""
+    return response_cache.stats()
+
+
+@app.get("/health/models")
+def model_residency_health():
+    """Models loaded on each backend and preload counters."""
+    return residency_manager.stats()
+
+
+@app.get("/health/model-catalog")
+def model_catalog_health():
+    """Model catalog size, age and refresh counters."""
+    return model_catalog.stats()
+
+
+@app.get("/health/ingestion")
+def ingestion_health():
+    """Ingestion queue, per-stage throughput and embedding cache counters."""
+    return ingestion_pipeline.stats()
+
+
+@app.get("/health/retrieval")
+def retrieval_health():
+    """Retrieval counters and the vector indexes opened so far."""
+    return {"retriever": retriever.stats(), "indexes": vector_store.stats()}
+
+
+# Gauges over live state, read when /metrics is scraped
+metrics.registry.gauge(
+    "neuroline_generations_in_flight",
+    "Chat generations streaming from Ollama",
+    ("model", "backend"),
+    lambda: ollama_service.generating.items(),
+)
+metrics.registry.gauge(
+    "neuroline_backend_in_flight",
+    "Requests of any kind in flight to each Ollama backend",
+    ("backend",),
+    lambda: (((b.base_url,), b.in_flight) for b in ollama_service.pool.backends),
+)
+metrics.registry.gauge(
+    "neuroline_scheduler_queued",
+    "Generations waiting for a slot",
+    ("model",),
+    lambda: (((m,), n) for m, n in generation_scheduler.stats()["queued_by_model"].items()),
+)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (on the event loop, so gauges read consistent state)."""
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,244 @@
+"""
+Prometheus instrumentation in the text exposition format: the metric
+primitives, the process-wide registry and the metrics themselves.
+
+Recording is a lock, a bisect and a few additions, so it stays on under
+load; rendering happens only when /metrics is scraped. Gauges are read
+from a callback at scrape time instead of being kept up to date.
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from fast DB queries up to long generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts (last is +Inf), sum, count]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labels) -> "_Timer":
+        """Context manager observing the seconds spent inside it."""
+        return _Timer(self, labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        lines = self.header()
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket
+                le = 'le="+Inf"' if bound == math.inf else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: LabelValues):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Gauge(_Metric):
+    """Gauge whose samples come from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str],
+                 read: Callable[[], Iterable[Tuple[LabelValues, float]]]):
+        super().__init__(name, documentation, labels)
+        self.read = read
+
+    def collect(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in self.read()
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str],
+              read: Callable[[], Iterable[Tuple[LabelValues, float]]]) -> Gauge:
+        return self.register(Gauge(name, documentation, labels, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware observing HTTP request latency by method, route template
+    and status. Streaming responses are timed until their last byte.
+    """
+
+    def __init__(self, app, histogram: Histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched route in the scope; templates keep label cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            self.histogram.observe(time.perf_counter() - started, scope["method"], path, str(status))
+
+
+# Process-wide registry rendered by /metrics; gauges over live state are added in app.main
+registry = Registry()
+
+# Buckets
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)
+FRAME_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# HTTP
+http_request_seconds = registry.histogram(
+    "neuroline_http_request_duration_seconds",
+    "HTTP request latency by route, until the last response byte",
+    ("method", "route", "status"),
+)
+
+# Generations (timings from Ollama's final stream frame)
+generation_ttft_seconds = registry.histogram(
+    "neuroline_generation_ttft_seconds",
+    "Time from sending a chat request to Ollama until its first token",
+    ("model",),
+)
+chat_ttft_seconds = registry.histogram(
+    "neuroline_chat_ttft_seconds",
+    "Time from a chat request arriving until its first generated token, including queue wait",
+    ("model",),
+)
+generation_tokens_per_second = registry.histogram(
+    "neuroline_generation_tokens_per_second",
+    "Generation speed (eval_count / eval_duration)",
+    ("model",),
+    buckets=TOKEN_RATE_BUCKETS,
+)
+generation_prompt_eval_seconds = registry.histogram(
+    "neuroline_generation_prompt_eval_seconds",
+    "Time Ollama spent evaluating the prompt",
+    ("model",),
+)
+generation_eval_seconds = registry.histogram(
+    "neuroline_generation_eval_seconds",
+    "Time Ollama spent generating the response",
+    ("model",),
+)
+
+# Scheduling
+queue_wait_seconds = registry.histogram(
+    "neuroline_scheduler_queue_wait_seconds",
+    "Time a generation waited for a slot",
+    ("model",),
+)
+
+# Database
+db_query_seconds = registry.histogram(
+    "neuroline_db_query_seconds",
+    "SQL statement execution time by statement type",
+    ("statement",),
+)
+db_commit_seconds = registry.histogram(
+    "neuroline_db_commit_seconds",
+    "Session commit time (flush included), on both engines",
+)
+
+# Server-sent events
+sse_frames_sent = registry.histogram(
+    "neuroline_sse_frames_per_stream",
+    "SSE frames (token batches, events, heartbeats) sent per stream",
+    buckets=FRAME_BUCKETS,
+)
@@ -6,8 +6,18 @@ from .schemas import (
     AgentUpdate,
     AgentResponse,
     MessageResponse,
+    ConversationResponse,
+    ConversationPage,
+    MessageSearchResult,
+    MessageSearchPage,
     ChatRequest,
     ChatResponse,
+    DocumentResponse,
+    UploadSessionCreate,
+    UploadSessionResponse,
+    PullRequest,
+    PullJobResponse,
+    BatchJobResponse,
 )
 
 __all__ = [
@@ -18,6 +28,16 @@ __all__ = [
     "AgentUpdate",
     "AgentResponse",
     "MessageResponse",
+    "ConversationResponse",
+    "ConversationPage",
+    "MessageSearchResult",
+    "MessageSearchPage",
     "ChatRequest",
     "ChatResponse",
+    "DocumentResponse",
+    "UploadSessionCreate",
+    "UploadSessionResponse",
+    "PullRequest",
+    "PullJobResponse",
+    "BatchJobResponse",
 ]
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from app.models.enums import ProjectType, ProjectStatus
 
 
@@ -60,6 +60,7 @@ class AgentResponse(AgentBase):
     id: int
     created_at: datetime
     updated_at: datetime
+    residency: Optional[str] = None  # "warm", "loading" or "cold" in Ollama
     
     class Config:
         from_attributes = True
@@ -78,12 +79,47 @@ class MessageCreate(MessageBase):
 class MessageResponse(MessageBase):
     id: int
     conversation_id: int
+    truncated: Optional[bool] = False
     created_at: datetime
     
     class Config:
         from_attributes = True
 
 
+# Conversation schemas
+class ConversationResponse(BaseModel):
+    id: int
+    agent_id: int
+    created_at: datetime
+    updated_at: datetime
+    message_count: int = 0
+    first_message: Optional[MessageResponse] = None
+    last_message: Optional[MessageResponse] = None
+    messages: Optional[List[MessageResponse]] = None  # Only with include_messages
+
+
+class ConversationPage(BaseModel):
+    items: List[ConversationResponse]
+    next_cursor: Optional[str] = None
+
+
+# Message search schemas
+class MessageSearchResult(BaseModel):
+    id: int
+    conversation_id: int
+    project_id: int
+    agent_id: int
+    role: str
+    created_at: datetime
+    snippet: str  # Matched terms wrapped in **
+    rank: float  # bm25, lower is a better match
+
+
+class MessageSearchPage(BaseModel):
+    items: List[MessageSearchResult]
+    next_cursor: Optional[str] = None
+
+
 # Chat schemas
 class ChatRequest(BaseModel):
     message: str = Field(..., min_length=1)
@@ -95,3 +131,71 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     conversation_id: int
     message: MessageResponse
+
+
+# Document schemas
+class DocumentResponse(BaseModel):
+    id: int
+    project_id: int
+    filename: str
+    content_type: Optional[str] = None
+    size: int
+    sha256: str
+    ingest_status: Optional[str] = None
+    ingest_error: Optional[str] = None
+    chunk_count: Optional[int] = 0
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(..., min_length=1, max_length=255)
+    size: int = Field(..., ge=0)
+    content_type: Optional[str] = None
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")  # Verified on completion
+
+
+class UploadSessionResponse(BaseModel):
+    id: Optional[str] = None  # None when the upload was satisfied by an existing blob
+    filename: str
+    size: int
+    offset: int
+    complete: bool
+    document: Optional[DocumentResponse] = None
+
+
+# Model schemas
+class PullRequest(BaseModel):
+    model: str = Field(..., min_length=1)
+    backend_url: Optional[str] = None  # Least-loaded backend if None
+
+
+class PullJobResponse(BaseModel):
+    id: str
+    model: str
+    backend_url: Optional[str] = None
+    state: str  # queued, downloading, completed, failed or cancelled
+    status: Optional[str] = None
+    digest: Optional[str] = None
+    total: Optional[int] = None
+    completed: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+
+# Batch schemas
+class BatchJobResponse(BaseModel):
+    id: str
+    state: str  # queued, running, completed, failed, cancelled or interrupted
+    project_id: int
+    agent_ids: List[int]
+    concurrency: int
+    total: int
+    completed: int
+    failed: int
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
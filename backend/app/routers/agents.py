@@ -1,12 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app.database import get_db, Agent
 from app.models import AgentCreate, AgentUpdate, AgentResponse
+from app.services.residency import residency_manager
 
 router = APIRouter(prefix="/api/agents", tags=["agents"])
 
 
+def _with_residency(agent: Agent) -> AgentResponse:
+    """Agent response annotated with whether its model is loaded in Ollama."""
+    response = AgentResponse.model_validate(agent)
+    response.residency = residency_manager.status(agent.base_model)
+    return response
+
+
 @router.post("", response_model=AgentResponse, status_code=status.HTTP_201_CREATED)
 def create_agent(agent: AgentCreate, db: Session = Depends(get_db)):
     """Create a new agent."""
@@ -14,14 +22,25 @@ def create_agent(agent: AgentCreate, db: Session = Depends(get_db)):
     db.add(db_agent)
     db.commit()
     db.refresh(db_agent)
-    return db_agent
+    return _with_residency(db_agent)
 
 
 @router.get("", response_model=List[AgentResponse])
-def list_agents(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """List all agents."""
-    agents = db.query(Agent).offset(skip).limit(limit).all()
-    return agents
+def list_agents(
+    after_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    """
+    List agents by id; pass the last id seen as `after_id` for the next page.
+    `skip` (offset paging) is still accepted for existing clients.
+    """
+    query = db.query(Agent)
+    if after_id is not None:
+        query = query.filter(Agent.id > after_id)
+    agents = query.order_by(Agent.id).offset(skip).limit(limit).all()
+    return [_with_residency(agent) for agent in agents]
 
 
 @router.get("/{agent_id}", response_model=AgentResponse)
@@ -30,7 +49,7 @@ def get_agent(agent_id: int, db: Session = Depends(get_db)):
     agent = db.query(Agent).filter(Agent.id == agent_id).first()
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
-    return agent
+    return _with_residency(agent)
 
 
 @router.put("/{agent_id}", response_model=AgentResponse)
@@ -46,7 +65,7 @@ def update_agent(agent_id: int, agent_update: AgentUpdate, db: Session = Depends
     
     db.commit()
     db.refresh(agent)
-    return agent
+    return _with_residency(agent)
 
 
 @router.delete("/{agent_id}", status_code=status.HTTP_204_NO_CONTENT)
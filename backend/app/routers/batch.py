@@ -0,0 +1,105 @@
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
+from fastapi.responses import FileResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import asyncio
+from app.config import settings
+from app.database import get_async_db, Project, Agent
+from app.models import BatchJobResponse
+from app.services.batch import batch_runner, BatchError, BatchJob, RESULTS_FILE
+
+router = APIRouter(prefix="/api/batch", tags=["batch"])
+
+
+def _get_job(job_id: str) -> BatchJob:
+    job = batch_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job
+
+
+@router.post("/jobs", response_model=BatchJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_batch_job(
+    prompts: UploadFile = File(..., description="JSONL: one prompt string or {\"id\", \"prompt\"} object per line"),
+    project_id: int = Form(...),
+    agent_ids: List[int] = Form(...),
+    concurrency: Optional[int] = Form(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Run every prompt against every agent in the background; poll the job for progress."""
+    if not await db.get(Project, project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    agent_ids = list(dict.fromkeys(agent_ids))
+    agents = (await db.execute(select(Agent).where(Agent.id.in_(agent_ids)))).scalars().all()
+    missing = set(agent_ids) - {agent.id for agent in agents}
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Agents not found: {sorted(missing)}")
+
+    concurrency = concurrency or settings.batch_default_concurrency
+    if not 1 <= concurrency <= settings.batch_max_concurrency:
+        raise HTTPException(
+            status_code=400,
+            detail=f"concurrency must be between 1 and {settings.batch_max_concurrency}",
+        )
+
+    data = await prompts.read()
+    try:
+        job = await batch_runner.create(
+            project_id=project_id,
+            agents=[
+                {
+                    "id": agent.id,
+                    "base_model": agent.base_model,
+                    "system_prompt": agent.system_prompt,
+                    "temperature": agent.temperature,
+                    "max_tokens": agent.max_tokens,
+                }
+                for agent in sorted(agents, key=lambda a: agent_ids.index(a.id))
+            ],
+            prompts_data=data,
+            concurrency=concurrency,
+        )
+    except BatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.status()
+
+
+@router.get("/jobs", response_model=List[BatchJobResponse])
+def list_batch_jobs():
+    """List batch jobs and their progress."""
+    return batch_runner.stats()
+
+
+@router.get("/jobs/{job_id}", response_model=BatchJobResponse)
+def get_batch_job(job_id: str):
+    """Progress of a batch job."""
+    return _get_job(job_id).status()
+
+
+@router.get("/jobs/{job_id}/results")
+def get_batch_results(job_id: str):
+    """Download the results written so far as JSONL."""
+    path = _get_job(job_id).directory / RESULTS_FILE
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="No results yet")
+    return FileResponse(path, media_type="application/x-ndjson", filename=f"batch-{job_id}.jsonl")
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=BatchJobResponse)
+async def cancel_batch_job(job_id: str):
+    """Stop a running job; finished results are kept and it can be resumed."""
+    job = _get_job(job_id)
+    batch_runner.cancel(job)
+    if job.task is not None:
+        await asyncio.gather(job.task, return_exceptions=True)
+    return job.status()
+
+
+@router.post("/jobs/{job_id}/resume", response_model=BatchJobResponse)
+async def resume_batch_job(job_id: str, retry_failed: bool = False):
+    """Continue a job from its last result, optionally re-running failed prompts."""
+    job = _get_job(job_id)
+    await batch_runner.resume(job, retry_failed)
+    return job.status()
@@ -1,137 +1,453 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db, Conversation, Message, Agent, Project
-from app.models import ChatRequest, MessageResponse
-from app.services.ollama import ollama_service
+from starlette.background import BackgroundTask
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional
+import anyio
+import asyncio
+import json
+import logging
+import time
+from app import metrics
+from app.database import (
+    get_db, get_async_db, SessionLocal,
+    Conversation, Message, Agent, Project,
+)
+from app.models import (
+    ChatRequest, MessageResponse, ConversationResponse, ConversationPage, MessageSearchPage,
+)
+from app.services.ollama import LeaderAbandoned, ollama_service
+from app.services.context import context_manager, estimate_tokens
+from app.services.history import history_cache, history_entry
+from app.services.response_cache import ResponseCache, response_cache, is_cacheable
+from app.services.retrieval import retriever
+from app.services.scheduler import generation_scheduler, QueueFull
+from app.services.search import fts_query, search_messages
+from app.services.writer import message_writer
+from app.utils.pagination import encode_cursor, decode_cursor, encode_rank_cursor, decode_rank_cursor
+from app.utils.sse import SSEStream, SSE_HEADERS
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 500
+
+
+def _log_failed_write(future: asyncio.Future) -> None:
+    # Nobody awaits a truncated answer's write, so surface failures here
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Failed to save truncated answer: %s", future.exception())
+
 
 @router.post("/stream")
-async def chat_stream(chat_request: ChatRequest, db: Session = Depends(get_db)):
+async def chat_stream(chat_request: ChatRequest, db: AsyncSession = Depends(get_async_db)):
     """Send a message and get streaming response."""
+    received = time.perf_counter()
     
     # Verify project exists
-    project = db.query(Project).filter(Project.id == chat_request.project_id).first()
+    project = await db.get(Project, chat_request.project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
     # Verify agent exists
-    agent = db.query(Agent).filter(Agent.id == chat_request.agent_id).first()
+    agent = await db.get(Agent, chat_request.agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
-    # Get or create conversation
+    # Verify conversation exists
+    conversation = None
     if chat_request.conversation_id:
-        conversation = db.query(Conversation).filter(
+        conversation = (await db.execute(select(Conversation).where(
             Conversation.id == chat_request.conversation_id,
             Conversation.project_id == chat_request.project_id
-        ).first()
+        ))).scalar_one_or_none()
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
-    else:
-        # Create new conversation
-        conversation = Conversation(
-            project_id=chat_request.project_id,
-            agent_id=chat_request.agent_id
+    
+    # History so far; the new message is only written once the turn is admitted
+    history = None
+    if conversation is not None:
+        # The previous answer may still be in the write-behind queue; commit it first
+        if message_writer.has_pending(conversation.id):
+            await message_writer.flush()
+        history = history_cache.get(conversation.id)
+        if history is None:
+            messages = (await db.execute(select(Message).where(
+                Message.conversation_id == conversation.id
+            ).order_by(Message.created_at))).scalars().all()
+            history = [history_entry(msg) for msg in messages]
+            history_cache.put(conversation.id, history)
+    pending = {
+        "id": None,
+        "role": "user",
+        "content": chat_request.message,
+        "tokens": estimate_tokens(chat_request.message),
+    }
+    
+    # Project documents relevant to this message, if found within the latency budget
+    rag_context = await retriever.context_for(project.id, chat_request.message)
+    
+    # Fit history into the context window, newest turns first
+    window = context_manager.build(
+        [*(history or []), pending],
+        max_tokens=agent.max_tokens,
+        system_prompt=agent.system_prompt,
+        summary=conversation.summary if conversation else None,
+        summary_message_id=conversation.summary_message_id if conversation else None,
+        reserved_tokens=estimate_tokens(rag_context),
+    )
+    if rag_context:
+        # Just before the new message, so earlier turns stay a reusable prompt prefix
+        window.messages.insert(len(window.messages) - 1, {"role": "system", "content": rag_context})
+    
+    # Deterministic agents may replay a stored answer without touching Ollama
+    cache_key = None
+    cached = None
+    if is_cacheable(agent.temperature):
+        cache_key = ResponseCache.key(
+            agent.base_model,
+            agent.system_prompt,
+            {"temperature": agent.temperature, "num_predict": agent.max_tokens,
+             "num_ctx": window.num_ctx},
+            window.messages,
         )
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
-    
-    # Save user message
-    user_message = Message(
-        conversation_id=conversation.id,
-        role="user",
-        content=chat_request.message
+        cached = await response_cache.aget(cache_key)
+    
+    payload = ollama_service.chat_payload(
+        model=agent.base_model,
+        messages=window.messages,
+        temperature=agent.temperature,
+        max_tokens=agent.max_tokens,
+        system_prompt=agent.system_prompt,
+        num_ctx=window.num_ctx,
     )
-    db.add(user_message)
-    db.commit()
     
-    # Get conversation history
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation.id
-    ).order_by(Message.created_at).all()
+    # An identical deterministic generation in flight is followed without a slot;
+    # only a request that starts a generation is admitted by the scheduler
+    ticket = None
+    ready = None
+    stream = None
+    
+    def admit() -> None:
+        """Join an identical generation in flight, or take a slot (may raise QueueFull)."""
+        nonlocal ticket, ready, stream
+        ticket = ready = None
+        coalescible = ollama_service.coalescible(payload)
+        stream = ollama_service.join(payload) if coalescible else None
+        if stream is not None:
+            return
+        ticket = generation_scheduler.submit(agent.base_model, project.id)
+        if coalescible:
+            # Registered now so identical requests join while this one waits for its slot;
+            # the slot is held until the shared generation ends, whoever is still listening
+            ready = asyncio.get_running_loop().create_future()
+            stream = ollama_service.lead(
+                payload, ready, affinity_key=conversation.id if conversation else None,
+                on_done=ticket.release,
+            )
+    
+    if cached is None:
+        try:
+            admit()
+        except QueueFull as e:
+            raise HTTPException(
+                status_code=(
+                    status.HTTP_429_TOO_MANY_REQUESTS if e.scope == "project"
+                    else status.HTTP_503_SERVICE_UNAVAILABLE
+                ),
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)},
+            )
+    
+    def abandon() -> None:
+        """Free the slot, and hand a shared generation that never started back to its followers."""
+        if ready is not None:
+            if ready.done():
+                return  # The shared generation started and releases the slot when it ends
+            ready.set_exception(LeaderAbandoned("The shared generation was abandoned before it started"))
+        if ticket is not None:
+            ticket.release()
+    
+    try:
+        if conversation is None:
+            # Create new conversation
+            conversation = Conversation(
+                project_id=chat_request.project_id,
+                agent_id=chat_request.agent_id
+            )
+            db.add(conversation)
+            await db.commit()
+        
+        # Save user message (batched with other turns' writes)
+        user_message = await message_writer.add_message(
+            conversation.id, "user", chat_request.message
+        )
+        entry = history_entry(user_message)
+        if history_cache.append(conversation.id, entry) is None:
+            history_cache.put(conversation.id, [*(history or []), entry])
+    except Exception:
+        abandon()
+        raise
     
-    # Convert to Ollama format
-    ollama_messages = [
-        {"role": msg.role, "content": msg.content}
-        for msg in messages
-    ]
+    if stream is None and cached is None:
+        stream = ollama_service.stream_payload(payload, affinity_key=conversation.id)
     
     # Stream response from Ollama
-    async def generate():
-        assistant_content = ""
+    async def events():
+        parts = []
+        stats = {}
+        generated = False
         
         # Send conversation ID first
-        yield f"data: {{'conversation_id': {conversation.id}}}\n\n"
+        yield {"conversation_id": conversation.id}
         
         try:
-            async for chunk in ollama_service.generate_stream(
-                model=agent.base_model,
-                messages=ollama_messages,
-                temperature=agent.temperature,
-                max_tokens=agent.max_tokens,
-                system_prompt=agent.system_prompt
-            ):
-                assistant_content += chunk
-                yield f"data: {{'content': '{chunk}'}}\n\n"
+            if cached is not None:
+                stats["cached"] = True
+                parts.append(cached)
+                yield cached
+            else:
+                while True:
+                    if ticket is not None:
+                        # Report queue position until a slot is free
+                        async for position in ticket.wait():
+                            yield {"queue_position": position}
+                        if ready is not None:
+                            ready.set_result(None)
+                    
+                    try:
+                        async for chunk in ollama_service.texts(stream, stats):
+                            if not parts:
+                                metrics.chat_ttft_seconds.observe(time.perf_counter() - received, agent.base_model)
+                            parts.append(chunk)
+                            yield chunk
+                        break
+                    except LeaderAbandoned:
+                        # The request this one followed left while queued: join or lead afresh
+                        admit()
+            generated = True
+            
+            content = "".join(parts)
+            if cache_key and cached is None and content:
+                await response_cache.aput(cache_key, content)
             
             # Save assistant message
-            assistant_message = Message(
+            assistant_message = await message_writer.add_message(
+                conversation.id, "assistant", content
+            )
+            history_cache.append(conversation.id, history_entry(assistant_message))
+            
+            # Fold trimmed turns into the rolling summary off the request path
+            context_manager.schedule_summary(
                 conversation_id=conversation.id,
-                role="assistant",
-                content=assistant_content
+                project_id=project.id,
+                model=agent.base_model,
+                summary=conversation.summary,
+                summary_message_id=conversation.summary_message_id,
+                overflow=window.overflow,
             )
-            db.add(assistant_message)
-            db.commit()
             
-            yield f"data: {{'done': true}}\n\n"
+            # Estimated history tokens next to Ollama's prompt_eval_count: a count
+            # well below the estimate means the cached prompt prefix was reused
+            stats["context_tokens"] = window.prompt_tokens
+            yield {"done": True, "stats": stats}
             
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client disconnected mid-answer: upstream is already being torn down,
+            # keep the partial answer marked as truncated
+            if parts and not generated:
+                saved = message_writer.submit(conversation.id, "assistant", "".join(parts), truncated=True)
+                saved.add_done_callback(_log_failed_write)
+                # Drop the cached history once the write lands, so a turn that cached it
+                # in between cannot keep serving it without the truncated answer
+                conversation_id = conversation.id
+                saved.add_done_callback(lambda _: history_cache.invalidate([conversation_id]))
+                history_cache.invalidate([conversation_id])
+            raise
         except Exception as e:
-            yield f"data: {{'error': '{str(e)}'}}\n\n"
+            yield {"error": str(e)}
+        finally:
+            abandon()
     
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    # The background task also frees the slot if the client leaves before streaming starts
+    return StreamingResponse(
+        SSEStream().encode(events()),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+        background=BackgroundTask(abandon),
+    )
 
 
-@router.get("/conversations/{project_id}", response_model=List[dict])
-def get_conversations(project_id: int, db: Session = Depends(get_db)):
-    """Get all conversations for a project."""
-    conversations = db.query(Conversation).filter(
+@router.get("/conversations/{project_id}", response_model=ConversationPage)
+def get_conversations(
+    project_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    include_messages: bool = False,
+    db: Session = Depends(get_db),
+):
+    """Get a page of a project's conversations, most recently updated first."""
+    # Message count and first/last message ids ride along as scalar subqueries
+    message_count = select(func.count(Message.id)).where(
+        Message.conversation_id == Conversation.id
+    ).correlate(Conversation).scalar_subquery()
+    first_id = select(func.min(Message.id)).where(
+        Message.conversation_id == Conversation.id
+    ).correlate(Conversation).scalar_subquery()
+    last_id = select(func.max(Message.id)).where(
+        Message.conversation_id == Conversation.id
+    ).correlate(Conversation).scalar_subquery()
+    
+    query = db.query(Conversation, message_count, first_id, last_id).filter(
         Conversation.project_id == project_id
-    ).all()
+    )
+    if cursor:
+        updated_at, conv_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Conversation.updated_at < updated_at,
+            and_(Conversation.updated_at == updated_at, Conversation.id < conv_id),
+        ))
+    if include_messages:
+        query = query.options(selectinload(Conversation.messages))
     
-    result = []
-    for conv in conversations:
-        messages = db.query(Message).filter(
-            Message.conversation_id == conv.id
-        ).order_by(Message.created_at).all()
-        
-        result.append({
-            "id": conv.id,
-            "agent_id": conv.agent_id,
-            "created_at": conv.created_at,
-            "messages": [
-                {
-                    "id": msg.id,
-                    "role": msg.role,
-                    "content": msg.content,
-                    "created_at": msg.created_at
-                }
-                for msg in messages
-            ]
-        })
+    rows = query.order_by(
+        Conversation.updated_at.desc(), Conversation.id.desc()
+    ).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_conv = rows[-1][0]
+        next_cursor = encode_cursor(last_conv.updated_at, last_conv.id)
+    
+    # One query for every preview message on the page
+    preview_ids = {msg_id for row in rows for msg_id in row[2:] if msg_id is not None}
+    previews = {}
+    if preview_ids and not include_messages:
+        previews = {
+            msg.id: msg
+            for msg in db.query(Message).filter(Message.id.in_(preview_ids))
+        }
+    
+    items = []
+    for conv, count, first, last in rows:
+        if include_messages:
+            previews = {msg.id: msg for msg in conv.messages}
+        items.append(ConversationResponse(
+            id=conv.id,
+            agent_id=conv.agent_id,
+            created_at=conv.created_at,
+            updated_at=conv.updated_at,
+            message_count=count,
+            first_message=previews.get(first),
+            last_message=previews.get(last),
+            messages=conv.messages if include_messages else None,
+        ))
+    
+    return ConversationPage(items=items, next_cursor=next_cursor)
+
+
+@router.get("/search", response_model=MessageSearchPage)
+def search(
+    q: str = Query(..., min_length=1, max_length=500),
+    project_id: Optional[int] = None,
+    agent_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    """
+    Full-text search over message content, best matches first.
+
+    Every word must match; end a word with * for a prefix match. Messages
+    still queued by the writer show up once they are committed.
+    """
+    query = fts_query(q)
+    if query is None:
+        raise HTTPException(status_code=400, detail="Search query has no terms")
+    after = decode_rank_cursor(cursor) if cursor else None
+    try:
+        rows = search_messages(db, query, project_id, agent_id, limit + 1, after)
+    except OperationalError:
+        raise HTTPException(status_code=503, detail="Message search is not available")
     
-    return result
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_rank_cursor(rows[-1]["rank"], rows[-1]["id"])
+    return MessageSearchPage(items=rows, next_cursor=next_cursor)
+
+
+def _read_your_writes(conversation_id: int) -> None:
+    """From a sync route, commit queued messages for a conversation before reading it."""
+    if message_writer.has_pending(conversation_id):
+        anyio.from_thread.run(message_writer.flush)
 
 
 @router.get("/messages/{conversation_id}", response_model=List[MessageResponse])
-def get_messages(conversation_id: int, db: Session = Depends(get_db)):
-    """Get all messages in a conversation."""
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.created_at).all()
+def get_messages(
+    conversation_id: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    """
+    Get a page of messages in a conversation, oldest first.
+    
+    Without a cursor this returns the newest `limit` messages. Pass the first
+    message id as `before` to page back, or the last id as `after` to page
+    forward.
+    """
+    _read_your_writes(conversation_id)
+    query = db.query(Message).filter(Message.conversation_id == conversation_id)
+    if after is not None:
+        return query.filter(Message.id > after).order_by(Message.id).limit(limit).all()
     
+    if before is not None:
+        query = query.filter(Message.id < before)
+    messages = query.order_by(Message.id.desc()).limit(limit).all()
+    messages.reverse()
     return messages
+
+
+@router.get("/messages/{conversation_id}/export")
+def export_messages(conversation_id: int, db: Session = Depends(get_db)):
+    """Stream every message in a conversation as NDJSON."""
+    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    _read_your_writes(conversation_id)
+    
+    def rows():
+        # Own session: the request-scoped one may be closed while streaming
+        export_db = SessionLocal()
+        try:
+            result = export_db.execute(
+                select(Message)
+                .where(Message.conversation_id == conversation_id)
+                .order_by(Message.id)
+                .execution_options(yield_per=EXPORT_BATCH_SIZE)
+            ).scalars()
+            for msg in result:
+                yield json.dumps({
+                    "id": msg.id,
+                    "conversation_id": msg.conversation_id,
+                    "role": msg.role,
+                    "content": msg.content,
+                    "created_at": msg.created_at.isoformat() if msg.created_at else None,
+                }) + "\n"
+        finally:
+            export_db.close()
+    
+    return StreamingResponse(
+        rows(),
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Disposition": f'attachment; filename="conversation-{conversation_id}.ndjson"'
+        },
+    )
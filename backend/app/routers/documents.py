@@ -0,0 +1,250 @@
+import asyncio
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse, JSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Tuple
+from app.config import settings
+from app.database import get_async_db, Project, Document, DocumentChunk
+from app.models import DocumentResponse, UploadSessionCreate, UploadSessionResponse
+from app.services.ingestion import ingestion_pipeline
+from app.services.vectors import vector_store
+from app.services.uploads import (
+    blob_store,
+    UploadError,
+    UploadTooLarge,
+    OffsetMismatch,
+    ChecksumMismatch,
+)
+
+router = APIRouter(prefix="/api/projects", tags=["documents"])
+
+
+async def _get_project(db: AsyncSession, project_id: int) -> Project:
+    project = await db.get(Project, project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return project
+
+
+async def _record(
+    db: AsyncSession, project_id: int, filename: str, content_type: str | None, sha256: str, size: int
+) -> Tuple[Document, bool]:
+    """Create the document row, or return the existing one for the same file."""
+    existing = (await db.execute(select(Document).where(
+        Document.project_id == project_id,
+        Document.sha256 == sha256,
+        Document.filename == filename,
+    ))).scalars().first()
+    if existing:
+        return existing, False
+
+    document = Document(
+        project_id=project_id,
+        filename=filename,
+        content_type=content_type,
+        size=size,
+        sha256=sha256,
+    )
+    db.add(document)
+    await db.commit()
+    await db.refresh(document)
+    ingestion_pipeline.enqueue(document.id)
+    return document, True
+
+
+def _upload_error(e: UploadError) -> HTTPException:
+    if isinstance(e, UploadTooLarge):
+        return HTTPException(status_code=413, detail=str(e))
+    if isinstance(e, OffsetMismatch):
+        return HTTPException(status_code=409, detail=str(e), headers={"Upload-Offset": str(e.offset)})
+    if isinstance(e, ChecksumMismatch):
+        return HTTPException(status_code=422, detail=str(e))
+    return HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/{project_id}/documents", response_model=DocumentResponse, status_code=status.HTTP_201_CREATED)
+async def upload_document(
+    project_id: int,
+    request: Request,
+    filename: str = Query(..., min_length=1, max_length=255),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Upload a file as the raw request body.
+
+    The body is streamed to disk and hashed on the fly; bytes already stored
+    (in any project) are not written again.
+    """
+    await _get_project(db, project_id)
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > settings.max_upload_size:
+        raise HTTPException(status_code=413, detail=f"File exceeds {settings.max_upload_size} bytes")
+
+    try:
+        sha256, size = await blob_store.write(request.stream())
+    except UploadError as e:
+        raise _upload_error(e)
+
+    content_type = request.headers.get("content-type")
+    try:
+        document, created = await _record(db, project_id, filename, content_type, sha256, size)
+    finally:
+        blob_store.unpin(sha256)
+    if not created:
+        return JSONResponse(DocumentResponse.model_validate(document).model_dump(mode="json"))
+    return document
+
+
+@router.get("/{project_id}/documents", response_model=List[DocumentResponse])
+async def list_documents(project_id: int, db: AsyncSession = Depends(get_async_db)):
+    """List a project's documents."""
+    await _get_project(db, project_id)
+    return (await db.execute(
+        select(Document).where(Document.project_id == project_id).order_by(Document.id)
+    )).scalars().all()
+
+
+@router.post("/{project_id}/documents/ingest")
+async def ingest_documents(project_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Queue the project's new or changed documents for chunking and embedding."""
+    await _get_project(db, project_id)
+    return {"queued": await ingestion_pipeline.enqueue_pending(project_id)}
+
+
+@router.get("/{project_id}/documents/{document_id}/content")
+async def get_document_content(project_id: int, document_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Download a document's bytes."""
+    document = await db.get(Document, document_id)
+    if not document or document.project_id != project_id:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return FileResponse(
+        blob_store.path(document.sha256),
+        media_type=document.content_type or "application/octet-stream",
+        filename=document.filename,
+    )
+
+
+@router.delete("/{project_id}/documents/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_document(project_id: int, document_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Delete a document; its blob is removed once nothing else references it."""
+    document = await db.get(Document, document_id)
+    if not document or document.project_id != project_id:
+        raise HTTPException(status_code=404, detail="Document not found")
+    sha256 = document.sha256
+    chunk_ids = (await db.execute(
+        select(DocumentChunk.id).where(DocumentChunk.document_id == document_id)
+    )).scalars().all()
+    await db.delete(document)
+    await db.commit()
+    await asyncio.to_thread(vector_store.delete, project_id, chunk_ids)
+    await asyncio.to_thread(blob_store.collect, [sha256])
+    return None
+
+
+# Resumable uploads: create a session, PATCH chunks with an Upload-Offset
+# header, and GET the session after a dropped connection to find where to resume.
+
+@router.post("/{project_id}/uploads", response_model=UploadSessionResponse, status_code=status.HTTP_201_CREATED)
+async def create_upload(
+    project_id: int, upload: UploadSessionCreate, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Start a resumable upload. A sha256 of a file this project already has
+    completes it without sending any bytes; knowing a hash is not proof of
+    holding the content, so other projects' files are never attached this way.
+    """
+    await _get_project(db, project_id)
+    sha256 = upload.sha256.lower() if upload.sha256 else None
+    if sha256 and (await db.execute(select(Document.id).where(
+        Document.project_id == project_id, Document.sha256 == sha256,
+    ))).first():
+        blob_store.pin(sha256)
+        try:
+            try:
+                size = (await asyncio.to_thread(blob_store.path(sha256).stat)).st_size
+            except FileNotFoundError:
+                size = None
+            if size is not None:
+                if size != upload.size:
+                    raise HTTPException(
+                        status_code=422, detail=f"File with this sha256 is {size} bytes, not {upload.size}"
+                    )
+                document, _ = await _record(db, project_id, upload.filename, upload.content_type, sha256, size)
+                return UploadSessionResponse(
+                    filename=upload.filename, size=size, offset=size,
+                    complete=True, document=document,
+                )
+        finally:
+            blob_store.unpin(sha256)
+
+    try:
+        session = blob_store.create_session(
+            project_id, upload.filename, upload.size, upload.content_type, upload.sha256
+        )
+    except UploadError as e:
+        raise _upload_error(e)
+    return UploadSessionResponse(
+        id=session["id"], filename=upload.filename, size=upload.size, offset=0, complete=False
+    )
+
+
+def _get_session(project_id: int, upload_id: str):
+    try:
+        session = blob_store.get_session(upload_id)
+    except UploadError:
+        session = None
+    if session is None or session["project_id"] != project_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+
+@router.get("/{project_id}/uploads/{upload_id}", response_model=UploadSessionResponse)
+def get_upload(project_id: int, upload_id: str):
+    """Current offset of a resumable upload."""
+    session = _get_session(project_id, upload_id)
+    return UploadSessionResponse(
+        id=session["id"], filename=session["filename"], size=session["size"],
+        offset=session["offset"], complete=False,
+    )
+
+
+@router.patch("/{project_id}/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def upload_chunk(
+    project_id: int,
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Append the request body at Upload-Offset; the last chunk creates the document."""
+    session = _get_session(project_id, upload_id)
+    try:
+        offset = await blob_store.append(session, upload_offset, request.stream())
+        if offset < session["size"]:
+            return UploadSessionResponse(
+                id=session["id"], filename=session["filename"], size=session["size"],
+                offset=offset, complete=False,
+            )
+        sha256 = await blob_store.finish(session)
+    except UploadError as e:
+        raise _upload_error(e)
+
+    try:
+        document, _ = await _record(
+            db, project_id, session["filename"], session["content_type"], sha256, session["size"]
+        )
+    finally:
+        blob_store.unpin(sha256)
+    return UploadSessionResponse(
+        id=session["id"], filename=session["filename"], size=session["size"],
+        offset=session["size"], complete=True, document=document,
+    )
+
+
+@router.delete("/{project_id}/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+def cancel_upload(project_id: int, upload_id: str):
+    """Abandon a resumable upload and delete its partial data."""
+    _get_session(project_id, upload_id)
+    blob_store.cancel_session(upload_id)
+    return None
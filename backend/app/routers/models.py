@@ -0,0 +1,112 @@
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from typing import List
+import asyncio
+import httpx
+from app.config import settings
+from app.models import PullRequest, PullJobResponse
+from app.services.balancer import NoBackendAvailable
+from app.services.catalog import model_catalog
+from app.services.ollama import ollama_service
+from app.services.pulls import pull_manager, PullJob
+from app.utils.sse import SSEStream, SSE_HEADERS
+
+router = APIRouter(prefix="/api/models", tags=["models"])
+
+
+def _get_pull(job_id: str) -> PullJob:
+    job = pull_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Pull job not found")
+    return job
+
+
+def _etag_matches(if_none_match: str | None, etag: str | None) -> bool:
+    """If-None-Match per RFC 9110: a list of entity tags or "*", compared weakly."""
+    if not if_none_match or etag is None:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag.removeprefix("W/"):
+            return True
+    return False
+
+
+@router.get("")
+async def list_models(request: Request, response: Response):
+    """Models installed across all backends; supports If-None-Match."""
+    try:
+        models = await model_catalog.get()
+    except httpx.HTTPError:
+        raise HTTPException(status_code=503, detail="Ollama is unavailable")
+
+    headers = {
+        "ETag": model_catalog.etag,
+        "Cache-Control": f"private, max-age={settings.model_catalog_ttl}",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), model_catalog.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return {"models": models}
+
+
+@router.post("/pulls", response_model=PullJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def start_pull(pull_request: PullRequest):
+    """Start downloading a model; an identical pull in progress is returned instead."""
+    if pull_request.backend_url and ollama_service.pool.get(pull_request.backend_url) is None:
+        raise HTTPException(status_code=404, detail="Unknown Ollama backend")
+    try:
+        job = pull_manager.start_pull(pull_request.model, pull_request.backend_url)
+    except NoBackendAvailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.snapshot()
+
+
+@router.get("/pulls", response_model=List[PullJobResponse])
+def list_pulls():
+    """Running and recently finished pulls."""
+    return pull_manager.stats()
+
+
+@router.get("/pulls/{job_id}", response_model=PullJobResponse)
+def get_pull(job_id: str):
+    """Latest progress of a pull."""
+    return _get_pull(job_id).snapshot()
+
+
+@router.get("/pulls/{job_id}/events")
+async def stream_pull(job_id: str):
+    """Stream pull progress as SSE until the pull finishes."""
+    job = _get_pull(job_id)
+
+    async def events():
+        async for snapshot in job.follow():
+            snapshot["created_at"] = snapshot["created_at"].isoformat()
+            if snapshot["finished_at"] is not None:
+                snapshot["finished_at"] = snapshot["finished_at"].isoformat()
+            yield snapshot
+
+    return StreamingResponse(
+        SSEStream().encode(events()),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@router.delete("/pulls/{job_id}", response_model=PullJobResponse)
+async def cancel_pull(job_id: str):
+    """Cancel a pull; Ollama keeps the downloaded layers for a later pull."""
+    job = _get_pull(job_id)
+    pull_manager.cancel(job)
+    if job.task is not None:
+        await asyncio.gather(job.task, return_exceptions=True)
+    return job.snapshot()
+
+
+@router.delete("/{model_name:path}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_model(model_name: str):
+    """Delete a model from every backend."""
+    if not await ollama_service.delete_model(model_name):
+        raise HTTPException(status_code=404, detail="Model not found")
+    model_catalog.invalidate()
+    return None
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 from app.database import get_db, Project
 from app.models import ProjectCreate, ProjectUpdate, ProjectResponse
 from app.models.enums import PROJECT_TYPE_METADATA, PROJECT_STATUS_METADATA
+from app.services.history import history_cache
+from app.services.residency import residency_manager
+from app.services.uploads import blob_store
+from app.services.vectors import vector_store
 
 router = APIRouter(prefix="/api/projects", tags=["projects"])
 
@@ -20,9 +24,20 @@ def create_project(project: ProjectCreate, db: Session = Depends(get_db)):
 
 
 @router.get("", response_model=List[ProjectResponse])
-def list_projects(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """List all projects."""
-    projects = db.query(Project).offset(skip).limit(limit).all()
+def list_projects(
+    after_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    """
+    List projects by id; pass the last id seen as `after_id` for the next page.
+    `skip` (offset paging) is still accepted for existing clients.
+    """
+    query = db.query(Project)
+    if after_id is not None:
+        query = query.filter(Project.id > after_id)
+    projects = query.order_by(Project.id).offset(skip).limit(limit).all()
     return projects
 
 
@@ -58,8 +73,13 @@ def delete_project(project_id: int, db: Session = Depends(get_db)):
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
+    conversation_ids = [conv.id for conv in project.conversations]
+    sha256s = [doc.sha256 for doc in project.documents]
     db.delete(project)
     db.commit()
+    history_cache.invalidate(conversation_ids)
+    blob_store.collect(sha256s)
+    vector_store.drop(project_id)
     return None
 
 
@@ -84,4 +104,6 @@ def update_last_accessed(project_id: int, db: Session = Depends(get_db)):
     
     project.last_accessed = datetime.utcnow()
     db.commit()
+    # Opening a project: load its agents' models before the first message
+    residency_manager.request_preload(project_id)
     return {"success": True}
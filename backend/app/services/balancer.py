@@ -0,0 +1,207 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Dict, List, Set
+import httpx
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class NoBackendAvailable(RuntimeError):
+    """Raised when every configured Ollama backend is ejected."""
+
+
+class OllamaBackend:
+    """A single Ollama node with its own connection pool and load state."""
+
+    def __init__(self, base_url: str, transport: httpx.AsyncBaseTransport | None = None):
+        self.base_url = base_url.rstrip("/")
+        self.transport = transport
+        self.in_flight = 0
+        self.healthy = True  # Optimistic until the first probe says otherwise
+        self.consecutive_failures = 0
+        self.available_models: Set[str] = set()
+        self.loaded_models: Set[str] = set()
+        self.last_probe: float | None = None
+        self._client: httpx.AsyncClient | None = None
+
+    def _create_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=settings.ollama_max_connections,
+            max_keepalive_connections=settings.ollama_max_keepalive_connections,
+            keepalive_expiry=settings.ollama_keepalive_expiry,
+        )
+        timeout = httpx.Timeout(settings.ollama_timeout, connect=settings.ollama_connect_timeout)
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=limits,
+            timeout=timeout,
+            http2=settings.ollama_http2,
+            transport=self.transport,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared client for this node, created lazily."""
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def has_model(self, model: str) -> bool:
+        return _model_in(model, self.available_models)
+
+    def has_loaded(self, model: str) -> bool:
+        return _model_in(model, self.loaded_models)
+
+    def mark_success(self) -> None:
+        self.consecutive_failures = 0
+        if not self.healthy:
+            logger.info("Ollama backend %s re-admitted", self.base_url)
+        self.healthy = True
+
+    def mark_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.healthy and self.consecutive_failures >= settings.ollama_unhealthy_threshold:
+            logger.warning("Ollama backend %s ejected after %d failures",
+                           self.base_url, self.consecutive_failures)
+            self.healthy = False
+
+    async def probe(self) -> bool:
+        """Refresh health and model residency from /api/tags and /api/ps."""
+        timeout = settings.ollama_probe_timeout
+        try:
+            tags = await self.client.get("/api/tags", timeout=timeout)
+            tags.raise_for_status()
+            ps = await self.client.get("/api/ps", timeout=timeout)
+            ps.raise_for_status()
+        except (httpx.HTTPError, ValueError):
+            self.mark_failure()
+            return False
+
+        self.available_models = {m.get("name", "") for m in tags.json().get("models", [])}
+        self.loaded_models = {m.get("name", "") for m in ps.json().get("models", [])}
+        self.last_probe = time.monotonic()
+        self.mark_success()
+        return True
+
+    def status(self) -> Dict:
+        return {
+            "url": self.base_url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "available_models": sorted(self.available_models),
+            "loaded_models": sorted(self.loaded_models),
+        }
+
+
+def _model_in(model: str, names: Set[str]) -> bool:
+    """Match Ollama model names, treating a bare name as its ':latest' tag."""
+    if model in names:
+        return True
+    if ":" not in model:
+        return f"{model}:latest" in names
+    return False
+
+
+class BackendPool:
+    """Routes requests across Ollama nodes and keeps their health current."""
+
+    def __init__(self, backends: List[OllamaBackend]):
+        if not backends:
+            raise ValueError("At least one Ollama backend is required")
+        self.backends = backends
+        self._rr = itertools.count()
+        self._probe_task: asyncio.Task | None = None
+
+    @classmethod
+    def from_settings(cls) -> "BackendPool":
+        urls = settings.ollama_base_urls or [settings.ollama_base_url]
+        return cls([OllamaBackend(url) for url in urls])
+
+    @property
+    def primary(self) -> OllamaBackend:
+        return self.backends[0]
+
+    def healthy_backends(self) -> List[OllamaBackend]:
+        return [b for b in self.backends if b.healthy]
+
+    def get(self, base_url: str) -> OllamaBackend | None:
+        base_url = base_url.rstrip("/")
+        for backend in self.backends:
+            if backend.base_url == base_url:
+                return backend
+        return None
+
+    def pick(self, model: str | None = None, prefer: str | None = None) -> OllamaBackend:
+        """
+        Choose the least-loaded healthy backend for a model.
+
+        Nodes that do not list the model are skipped unless none do (tags may
+        be stale). Nodes without the model resident pay a configurable
+        in-flight penalty so warm nodes are preferred until they are busy.
+        A `prefer`red node (e.g. the one holding a conversation's prompt
+        cache) wins while it is a candidate and below its concurrency cap.
+        """
+        candidates = self.healthy_backends()
+        if not candidates:
+            raise NoBackendAvailable("No healthy Ollama backends available")
+
+        if model:
+            with_model = [b for b in candidates if b.has_model(model)]
+            if with_model:
+                candidates = with_model
+
+        if len(candidates) == 1:
+            return candidates[0]
+
+        if prefer is not None:
+            for backend in candidates:
+                if (backend.base_url == prefer
+                        and backend.in_flight < settings.scheduler_max_concurrent_per_backend):
+                    return backend
+
+        # Rotate the starting point so ties are spread round-robin
+        offset = next(self._rr) % len(candidates)
+        rotated = candidates[offset:] + candidates[:offset]
+        penalty = settings.ollama_cold_model_penalty
+
+        def load(backend: OllamaBackend) -> int:
+            cold = model is not None and not backend.has_loaded(model)
+            return backend.in_flight + (penalty if cold else 0)
+
+        return min(rotated, key=load)
+
+    async def probe_all(self) -> None:
+        await asyncio.gather(*(b.probe() for b in self.backends))
+
+    async def _probe_loop(self) -> None:
+        # startup() already ran the first probe
+        while True:
+            await asyncio.sleep(settings.ollama_probe_interval)
+            try:
+                await self.probe_all()
+            except Exception:
+                logger.exception("Ollama backend probe failed")
+
+    async def start(self) -> None:
+        """Begin periodic background health probes."""
+        if self._probe_task is None and settings.ollama_probe_interval > 0:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def close(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+        for backend in self.backends:
+            await backend.close()
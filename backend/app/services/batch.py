@@ -0,0 +1,327 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+from app.config import settings
+from app.services.ollama import ollama_service
+from app.services.scheduler import generation_scheduler
+from app.utils import fastjson
+
+logger = logging.getLogger(__name__)
+
+JOB_FILE = "job.json"
+PROMPTS_FILE = "prompts.jsonl"
+RESULTS_FILE = "results.jsonl"
+
+
+class BatchError(ValueError):
+    """Raised for an invalid batch job or prompt file."""
+
+
+def parse_prompts(data: bytes) -> List[Dict[str, Any]]:
+    """
+    Parse a JSONL prompt file.
+
+    Each line is either a JSON string or an object with a 'prompt' field and
+    an optional 'id'; lines without an id are numbered from 1.
+    """
+    prompts = []
+    for number, line in enumerate(data.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            item = fastjson.loads(line)
+        except fastjson.JSONDecodeError as e:
+            raise BatchError(f"Line {number} is not valid JSON: {e}") from e
+        if isinstance(item, str):
+            item = {"prompt": item}
+        if not isinstance(item, dict) or not isinstance(item.get("prompt"), str) or not item["prompt"]:
+            raise BatchError(f"Line {number} has no 'prompt' string")
+        prompts.append({"id": item.get("id", len(prompts) + 1), "prompt": item["prompt"]})
+    if not prompts:
+        raise BatchError("Prompt file is empty")
+    if len(prompts) > settings.batch_max_prompts:
+        raise BatchError(f"At most {settings.batch_max_prompts} prompts per job")
+    return prompts
+
+
+class BatchJob:
+    """
+    One bulk evaluation: every prompt against every agent snapshot.
+
+    State lives in its own directory under batch_dir: job.json (spec and
+    state), prompts.jsonl and results.jsonl, which gets one line per finished
+    (prompt, agent) pair. Work already in results.jsonl is skipped when a job
+    is resumed, so a crash only loses the pairs that were in flight.
+    """
+
+    def __init__(self, directory: Path, spec: Dict[str, Any]):
+        self.directory = directory
+        self.spec = spec
+        self.prompts: List[Dict[str, Any]] = []
+        self.done: Set[Tuple[int, int]] = set()
+        self.failed = 0
+        self.task: asyncio.Task | None = None
+
+    @property
+    def id(self) -> str:
+        return self.spec["id"]
+
+    @property
+    def total(self) -> int:
+        return len(self.prompts) * len(self.spec["agents"])
+
+    def save(self) -> None:
+        (self.directory / JOB_FILE).write_bytes(fastjson.dumps(self.spec))
+
+    def load(self, retry_failed: bool = False) -> None:
+        """Read prompts and the results written so far (the last row per pair wins)."""
+        self.prompts = parse_prompts((self.directory / PROMPTS_FILE).read_bytes())
+        outcomes: Dict[Tuple[int, int], bool] = {}
+        results = self.directory / RESULTS_FILE
+        if results.exists():
+            for line in results.read_bytes().splitlines():
+                try:
+                    row = fastjson.loads(line)
+                except fastjson.JSONDecodeError:
+                    continue  # Torn last line from a crash; that pair runs again
+                outcomes[(row["index"], row["agent_id"])] = bool(row.get("error"))
+        if retry_failed:
+            outcomes = {pair: failed for pair, failed in outcomes.items() if not failed}
+        self.done = set(outcomes)
+        self.failed = sum(outcomes.values())
+
+    def pending(self) -> List[Tuple[int, Dict[str, Any]]]:
+        return [
+            (index, agent)
+            for index in range(len(self.prompts))
+            for agent in self.spec["agents"]
+            if (index, agent["id"]) not in self.done
+        ]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "state": self.spec["state"],
+            "project_id": self.spec["project_id"],
+            "agent_ids": [agent["id"] for agent in self.spec["agents"]],
+            "concurrency": self.spec["concurrency"],
+            "total": self.total,
+            "completed": len(self.done),
+            "failed": self.failed,
+            "created_at": self.spec["created_at"],
+            "finished_at": self.spec.get("finished_at"),
+            "error": self.spec.get("error"),
+        }
+
+
+class BatchRunner:
+    """
+    Runs batch jobs in the background through the generation scheduler.
+
+    Generations run at background priority so a large job never crowds out
+    interactive chat, and job files are read and written in worker threads
+    to keep the event loop free.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.jobs: Dict[str, BatchJob] = {}
+
+    async def create(
+        self,
+        project_id: int,
+        agents: List[Dict[str, Any]],
+        prompts_data: bytes,
+        concurrency: int,
+    ) -> BatchJob:
+        """Validate and persist a job, then start it."""
+        job = await asyncio.to_thread(self._persist, project_id, agents, prompts_data, concurrency)
+        self.jobs[job.id] = job
+        self._start(job)
+        return job
+
+    def _persist(
+        self,
+        project_id: int,
+        agents: List[Dict[str, Any]],
+        prompts_data: bytes,
+        concurrency: int,
+    ) -> BatchJob:
+        parse_prompts(prompts_data)
+        job_id = uuid.uuid4().hex
+        directory = self.directory / job_id
+        directory.mkdir(parents=True)
+        (directory / PROMPTS_FILE).write_bytes(prompts_data)
+        job = BatchJob(directory, {
+            "id": job_id,
+            "project_id": project_id,
+            "agents": agents,  # Snapshot, so a resumed job uses the same configs
+            "concurrency": concurrency,
+            "state": "queued",
+            "created_at": datetime.utcnow().isoformat(),
+        })
+        job.save()
+        job.load()
+        return job
+
+    def get(self, job_id: str) -> BatchJob | None:
+        return self.jobs.get(job_id)
+
+    async def resume(self, job: BatchJob, retry_failed: bool = False) -> None:
+        if job.task is not None and not job.task.done():
+            return
+        await asyncio.to_thread(job.load, retry_failed)
+        if job.task is not None and not job.task.done():
+            return  # Resumed by a concurrent request while loading
+        job.spec.pop("error", None)
+        job.spec.pop("finished_at", None)
+        self._start(job)
+
+    def cancel(self, job: BatchJob) -> None:
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+
+    def _start(self, job: BatchJob) -> None:
+        job.task = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: BatchJob) -> None:
+        job.spec["state"] = "running"
+        await asyncio.to_thread(job.save)
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in job.pending():
+            queue.put_nowait(item)
+
+        results = await asyncio.to_thread(open, job.directory / RESULTS_FILE, "ab")
+        workers = [
+            asyncio.create_task(self._worker(job, queue, results))
+            for _ in range(min(job.spec["concurrency"], queue.qsize()))
+        ]
+        try:
+            await asyncio.gather(*workers)
+            job.spec["state"] = "completed"
+        except asyncio.CancelledError:
+            job.spec["state"] = "cancelled"
+            raise
+        except Exception as e:
+            logger.exception("Batch job %s failed", job.id)
+            job.spec["state"] = "failed"
+            job.spec["error"] = str(e)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            job.spec["finished_at"] = datetime.utcnow().isoformat()
+            await asyncio.to_thread(self._close, job, results)
+
+    @staticmethod
+    def _close(job: BatchJob, results) -> None:
+        results.close()
+        job.save()
+
+    @staticmethod
+    def _append(results, row: Dict[str, Any]) -> None:
+        # One line per pair, flushed right away so a resume can skip it
+        results.write(fastjson.dumps(row) + b"\n")
+        results.flush()
+
+    async def _worker(self, job: BatchJob, queue: asyncio.Queue, results) -> None:
+        while not queue.empty():
+            index, agent = queue.get_nowait()
+            row = await self._generate(job, index, agent)
+            await asyncio.to_thread(self._append, results, row)
+            job.done.add((index, agent["id"]))
+            if row["error"]:
+                job.failed += 1
+
+    async def _acquire(self, job: BatchJob, model: str):
+        """Wait for a background generation slot; interactive requests go first."""
+        ticket = generation_scheduler.submit(model, job.spec["project_id"], background=True)
+        try:
+            async for _ in ticket.wait():
+                pass
+        except BaseException:
+            ticket.release()
+            raise
+        return ticket
+
+    async def _generate(self, job: BatchJob, index: int, agent: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = job.prompts[index]
+        row = {
+            "index": index,
+            "prompt_id": prompt["id"],
+            "agent_id": agent["id"],
+            "model": agent["base_model"],
+            "response": None,
+            "error": None,
+        }
+        ticket = await self._acquire(job, agent["base_model"])
+        stats: Dict[str, Any] = {}
+        started = time.monotonic()
+        try:
+            parts = []
+            async for chunk in ollama_service.generate_stream(
+                model=agent["base_model"],
+                messages=[{"role": "user", "content": prompt["prompt"]}],
+                temperature=agent["temperature"],
+                max_tokens=agent["max_tokens"],
+                system_prompt=agent["system_prompt"],
+                stats=stats,
+            ):
+                parts.append(chunk)
+            row["response"] = "".join(parts)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            row["error"] = str(e) or type(e).__name__
+        finally:
+            ticket.release()
+        row["elapsed"] = round(time.monotonic() - started, 3)
+        row["stats"] = stats
+        return row
+
+    async def start(self) -> None:
+        """Load jobs from disk and resume the ones interrupted by a shutdown or crash."""
+        for job, loaded in await asyncio.to_thread(self._load_jobs):
+            self.jobs[job.id] = job
+            if loaded and job.spec["state"] in ("queued", "running", "interrupted"):
+                await self.resume(job)
+
+    def _load_jobs(self) -> List[Tuple[BatchJob, bool]]:
+        if not self.directory.exists():
+            return []
+        jobs = []
+        for directory in self.directory.iterdir():
+            try:
+                spec = fastjson.loads((directory / JOB_FILE).read_bytes())
+            except (OSError, fastjson.JSONDecodeError):
+                continue
+            job = BatchJob(directory, spec)
+            try:
+                job.load()
+            except (OSError, BatchError):
+                logger.exception("Could not load batch job %s", job.id)
+                jobs.append((job, False))
+                continue
+            jobs.append((job, True))
+        return jobs
+
+    async def stop(self) -> None:
+        """Stop running jobs; they are marked interrupted and resume on next start."""
+        running = [job for job in self.jobs.values() if job.task and not job.task.done()]
+        for job in running:
+            job.task.cancel()
+        await asyncio.gather(*(job.task for job in running), return_exceptions=True)
+        for job in running:
+            job.spec["state"] = "interrupted"
+            await asyncio.to_thread(job.save)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [job.status() for job in self.jobs.values()]
+
+
+# Singleton instance
+batch_runner = BatchRunner(settings.batch_dir)
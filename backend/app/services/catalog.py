@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Any, Dict, List
+import httpx
+from app.config import settings
+from app.services.balancer import OllamaBackend
+from app.services.ollama import ollama_service
+from app.utils import fastjson
+
+logger = logging.getLogger(__name__)
+
+
+class ModelCatalog:
+    """
+    Cached, merged view of the models installed on every Ollama backend.
+
+    Reads never wait on Ollama once the catalog has loaded: a stale catalog
+    is served while a refresh runs in the background, and a failed refresh
+    keeps the last good copy. Pulls and deletes invalidate it. The ETag is a
+    hash of the merged list, so it only changes when the models do.
+    """
+
+    def __init__(self):
+        self.models: List[Dict[str, Any]] = []
+        self.etag: str | None = None
+        self.fetched_at: float | None = None
+        self._refresh: asyncio.Task | None = None
+        self._task: asyncio.Task | None = None
+        self.refreshes = 0
+        self.errors = 0
+
+    @property
+    def fresh(self) -> bool:
+        return self.fetched_at is not None and time.monotonic() - self.fetched_at < settings.model_catalog_ttl
+
+    async def get(self) -> List[Dict[str, Any]]:
+        """The catalog, loading it on first use and refreshing it when stale."""
+        if self.fetched_at is None:
+            await self.refresh()
+        elif not self.fresh:
+            self._schedule_refresh()
+        return self.models
+
+    def invalidate(self) -> None:
+        """Mark the catalog stale and reload it in the background."""
+        self.fetched_at = None if not self.models else 0.0
+        self._schedule_refresh()
+
+    def _schedule_refresh(self) -> asyncio.Task:
+        # One refresh at a time; concurrent callers share it
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self._load())
+        return self._refresh
+
+    async def refresh(self) -> None:
+        await asyncio.shield(self._schedule_refresh())
+
+    async def _tags(self, backend: OllamaBackend) -> List[Dict[str, Any]]:
+        response = await backend.client.get("/api/tags", timeout=settings.ollama_list_timeout)
+        response.raise_for_status()
+        models = response.json().get("models", [])
+        backend.available_models = {m.get("name", "") for m in models}
+        return models
+
+    async def _load(self) -> None:
+        backends = ollama_service.pool.healthy_backends()
+        results = await asyncio.gather(*(self._tags(b) for b in backends), return_exceptions=True)
+
+        merged: Dict[str, Dict[str, Any]] = {}
+        failed = 0
+        for backend, result in zip(backends, results):
+            if isinstance(result, BaseException):
+                if not isinstance(result, (httpx.HTTPError, ValueError)):
+                    raise result
+                logger.warning("Listing models on %s failed: %s", backend.base_url, result)
+                failed += 1
+                continue
+            for model in result:
+                entry = merged.setdefault(model["name"], {**model, "backends": []})
+                entry["backends"].append(backend.base_url)
+
+        if failed == len(backends):
+            # Keep serving the last good catalog; retry on the next read
+            self.errors += 1
+            if self.fetched_at is None and not self.models:
+                raise httpx.HTTPError("No Ollama backend could list models")
+            return
+
+        self.models = sorted(merged.values(), key=lambda m: m["name"])
+        self.etag = '"' + hashlib.sha256(fastjson.dumps(self.models)).hexdigest()[:32] + '"'
+        self.fetched_at = time.monotonic()
+        self.refreshes += 1
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.model_catalog_ttl)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Model catalog refresh failed")
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        for task in (self._task, self._refresh):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._task = None
+        self._refresh = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "models": len(self.models),
+            "etag": self.etag,
+            "age": None if self.fetched_at is None else time.monotonic() - self.fetched_at,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+        }
+
+
+# Singleton instance
+model_catalog = ModelCatalog()
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Set
+from app.config import settings
+from sqlalchemy import update
+from app.database import AsyncSessionLocal, Conversation
+from app.services.ollama import ollama_service
+from app.services.scheduler import generation_scheduler
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and an "
+    "assistant. Merge the existing summary with the new messages into one concise "
+    "summary that keeps facts, decisions, names, code identifiers and open "
+    "questions. Reply with the summary only."
+)
+
+
+def estimate_tokens(text: str | None) -> int:
+    """Cheap token estimate for budgeting; avoids loading a tokenizer."""
+    if not text:
+        return 0
+    return int(len(text) / settings.context_chars_per_token) + 1
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """Estimated tokens for a chat message, including per-message framing."""
+    tokens = message.get("tokens")
+    if tokens is None:
+        tokens = estimate_tokens(message["content"])
+    return tokens + settings.context_message_overhead_tokens
+
+
+@dataclass
+class ContextWindow:
+    """History selected for one turn."""
+    messages: List[Dict[str, str]]  # Ready for Ollama (summary first, if any)
+    num_ctx: int
+    prompt_tokens: int
+    overflow: List[Dict[str, Any]] = field(default_factory=list)  # Turns to fold into the summary
+
+
+class ContextManager:
+    """Keeps each turn's prompt within a token budget using rolling summaries."""
+
+    def __init__(self):
+        self._summarizing: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def build(
+        self,
+        history: List[Dict[str, Any]],
+        max_tokens: int,
+        system_prompt: str | None = None,
+        summary: str | None = None,
+        summary_message_id: int | None = None,
+        reserved_tokens: int = 0,
+    ) -> ContextWindow:
+        """
+        Select the newest messages that fit the prompt budget.
+
+        Args:
+            history: Messages in order, as dicts with 'id', 'role', 'content'
+                and optionally a precomputed 'tokens' estimate
+            max_tokens: Tokens reserved for the response
+            system_prompt: Agent system prompt (counted against the budget)
+            summary: Persisted summary of earlier turns
+            summary_message_id: Id of the last message covered by the summary
+            reserved_tokens: Prompt tokens the caller adds itself (e.g. retrieved context)
+        """
+        num_ctx = max(settings.context_window, max_tokens + settings.context_min_history_tokens)
+        summary_message = None
+        if summary:
+            summary_message = {
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{summary}",
+            }
+
+        budget = num_ctx - max_tokens - reserved_tokens
+        if system_prompt:
+            budget -= estimate_tokens(system_prompt) + settings.context_message_overhead_tokens
+        if summary_message:
+            budget -= message_tokens(summary_message)
+
+        if summary_message_id is not None:
+            # Entries not saved yet (id None) are newer than any summary
+            history = [m for m in history if m["id"] is None or m["id"] > summary_message_id]
+
+        total = sum(message_tokens(m) for m in history)
+        if total <= budget:
+            kept = history
+        else:
+            # Trim below the budget so several turns fit before the next fold
+            target = budget * settings.context_keep_ratio if settings.context_summary_enabled else budget
+            kept_count = 0
+            used = 0
+            for message in reversed(history):
+                cost = message_tokens(message)
+                if kept_count and used + cost > target:
+                    break
+                used += cost
+                kept_count += 1
+            kept = history[len(history) - kept_count:]
+            total = used
+
+        overflow = history[:len(history) - len(kept)]
+        messages = [{"role": m["role"], "content": m["content"]} for m in kept]
+        if summary_message:
+            messages.insert(0, summary_message)
+            total += message_tokens(summary_message)
+
+        return ContextWindow(
+            messages=messages,
+            num_ctx=num_ctx,
+            prompt_tokens=total,
+            overflow=overflow if settings.context_summary_enabled else [],
+        )
+
+    def schedule_summary(
+        self,
+        conversation_id: int,
+        project_id: int,
+        model: str,
+        summary: str | None,
+        summary_message_id: int | None,
+        overflow: List[Dict[str, Any]],
+    ) -> None:
+        """Fold trimmed turns into the conversation summary in the background."""
+        if not overflow or conversation_id in self._summarizing:
+            return
+        self._summarizing.add(conversation_id)
+        task = asyncio.create_task(self._summarize(
+            conversation_id, project_id, model, summary, summary_message_id, overflow
+        ))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(
+        self,
+        conversation_id: int,
+        project_id: int,
+        model: str,
+        summary: str | None,
+        summary_message_id: int | None,
+        overflow: List[Dict[str, Any]],
+    ) -> None:
+        try:
+            # Background priority: summaries only use capacity chat turns leave free
+            ticket = generation_scheduler.submit(model, project_id, background=True)
+            try:
+                async for _ in ticket.wait():
+                    pass
+                transcript = "\n".join(f"{m['role']}: {m['content']}" for m in overflow)
+                prompt = f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"
+                new_summary = await ollama_service.complete(
+                    model=settings.context_summary_model or model,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                        {"role": "user", "content": prompt},
+                    ],
+                    temperature=0.2,
+                    max_tokens=settings.context_summary_max_tokens,
+                )
+            finally:
+                ticket.release()
+
+            if new_summary:
+                await self._store(conversation_id, summary_message_id, overflow[-1]["id"], new_summary.strip())
+        except Exception:
+            logger.exception("Failed to update summary for conversation %s", conversation_id)
+        finally:
+            self._summarizing.discard(conversation_id)
+
+    async def stop(self) -> None:
+        """Cancel summaries in progress; the turns are folded again on a later request."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _store(self, conversation_id: int, expected_id: int | None, new_id: int, summary: str) -> None:
+        # Only advance from the state the summary was built on, and leave
+        # updated_at alone so summarizing does not reorder conversations
+        current = (
+            Conversation.summary_message_id.is_(None) if expected_id is None
+            else Conversation.summary_message_id == expected_id
+        )
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation_id, current)
+                .values(
+                    summary=summary,
+                    summary_message_id=new_id,
+                    updated_at=Conversation.updated_at,
+                )
+            )
+            await db.commit()
+
+
+# Singleton instance
+context_manager = ContextManager()
@@ -0,0 +1,93 @@
+import asyncio
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List
+from app.config import settings
+
+
+def pack(vector: Iterable[float]) -> bytes:
+    """Store vectors as float32, like the vector index does."""
+    return array("f", vector).tobytes()
+
+
+class EmbeddingCache:
+    """
+    On-disk cache of chunk embeddings keyed by (model, chunk content hash).
+
+    A chunk's embedding depends only on its text and the model, so edited
+    documents and the same passage in several files reuse the stored vectors
+    and only new text is sent to Ollama. Blocking I/O runs in a worker thread.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.hits = 0
+        self.misses = 0
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, content_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, content_hash))"
+            )
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, bytes]:
+        """Packed vectors for the hashes that are cached."""
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            conn = self._connection()
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for content_hash, vector in conn.execute(
+                    f"SELECT content_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND content_hash IN ({placeholders})",
+                    (model, *batch),
+                ):
+                    found[content_hash] = vector
+            self.hits += len(found)
+            self.misses += len(set(hashes)) - len(found)
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, bytes]) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, content_hash, vector) VALUES (?, ?, ?)",
+                [(model, content_hash, vector) for content_hash, vector in vectors.items()],
+            )
+            conn.commit()
+
+    async def aget_many(self, model: str, hashes: List[str]) -> Dict[str, bytes]:
+        return await asyncio.to_thread(self.get_many, model, hashes)
+
+    async def aput_many(self, model: str, vectors: Dict[str, bytes]) -> None:
+        await asyncio.to_thread(self.put_many, model, vectors)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = 0
+            if self._conn is not None:
+                entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Singleton instance
+embedding_cache = EmbeddingCache(settings.embedding_cache_path)
@@ -0,0 +1,107 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List
+from app.config import settings
+from app.services.context import estimate_tokens
+
+# Rough per-message bookkeeping cost on top of the content bytes
+ENTRY_OVERHEAD_BYTES = 64
+
+
+def history_entry(message) -> Dict[str, Any]:
+    """Prepared form of a Message row, as consumed by the context builder."""
+    return {
+        "id": message.id,
+        "role": message.role,
+        "content": message.content,
+        "tokens": estimate_tokens(message.content),
+    }
+
+
+def _entry_size(entry: Dict[str, Any]) -> int:
+    return len(entry["content"].encode("utf-8")) + ENTRY_OVERHEAD_BYTES
+
+
+class HistoryCache:
+    """
+    LRU cache of prepared message lists per conversation, bounded by bytes.
+
+    The chat path appends to a cached list as messages are saved, so a hot
+    conversation never re-reads its history from the database. Sync routes
+    run in the threadpool, hence the lock.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[int, List[Dict[str, Any]]]" = OrderedDict()
+        self._sizes: Dict[int, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conversation_id: int) -> List[Dict[str, Any]] | None:
+        with self._lock:
+            history = self._entries.get(conversation_id)
+            if history is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(conversation_id)
+            self.hits += 1
+            return history
+
+    def put(self, conversation_id: int, history: List[Dict[str, Any]]) -> None:
+        size = sum(_entry_size(e) for e in history)
+        with self._lock:
+            self._remove(conversation_id)
+            if size > self.max_bytes:
+                return
+            self._entries[conversation_id] = history
+            self._sizes[conversation_id] = size
+            self._bytes += size
+            self._evict()
+
+    def append(self, conversation_id: int, entry: Dict[str, Any]) -> List[Dict[str, Any]] | None:
+        """Append to a cached history; returns it, or None if not cached."""
+        with self._lock:
+            history = self._entries.get(conversation_id)
+            if history is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            history.append(entry)
+            size = _entry_size(entry)
+            self._sizes[conversation_id] += size
+            self._bytes += size
+            self._entries.move_to_end(conversation_id)
+            self._evict()
+            return history
+
+    def invalidate(self, conversation_ids: Iterable[int]) -> None:
+        with self._lock:
+            for conversation_id in conversation_ids:
+                self._remove(conversation_id)
+
+    def _remove(self, conversation_id: int) -> None:
+        if conversation_id in self._entries:
+            del self._entries[conversation_id]
+            self._bytes -= self._sizes.pop(conversation_id)
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            conversation_id = next(iter(self._entries))
+            self._remove(conversation_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "conversations": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Singleton instance
+history_cache = HistoryCache(settings.history_cache_max_bytes)
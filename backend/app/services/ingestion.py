@@ -0,0 +1,326 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Dict, List, Set
+import numpy as np
+from sqlalchemy import delete, select, update
+from app.config import settings
+from app.database import AsyncSessionLocal, Document, DocumentChunk
+from app.services.embeddings import embedding_cache, pack
+from app.services.ollama import ollama_service
+from app.services.uploads import blob_store
+from app.services.vectors import vector_store
+
+logger = logging.getLogger(__name__)
+
+# Bump when stored ingestion output changes shape, so documents are redone
+INGEST_VERSION = 2
+
+
+class UnsupportedDocument(ValueError):
+    """Raised when no text can be extracted from a file."""
+
+
+# Extraction and chunking run in worker processes, so they are plain functions
+
+
+class _TextExtractor(HTMLParser):
+    SKIP = {"script", "style", "head"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts: List[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+        elif tag in ("p", "br", "div", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6"):
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skipping:
+            self._skipping -= 1
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+def extract_text(path: Path, filename: str, content_type: str | None) -> str:
+    """Plain text of an uploaded file (text, Markdown, code, HTML, or PDF with pypdf)."""
+    suffix = Path(filename).suffix.lower()
+    content_type = (content_type or "").split(";")[0].strip()
+
+    if suffix == ".pdf" or content_type == "application/pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise UnsupportedDocument("PDF extraction requires pypdf")
+        return "\n\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+
+    data = Path(path).read_bytes()
+    if b"\x00" in data[:8192]:
+        raise UnsupportedDocument(f"Cannot extract text from binary file {filename}")
+    text = data.decode("utf-8", errors="replace")
+
+    if suffix in (".html", ".htm") or content_type == "text/html":
+        parser = _TextExtractor()
+        parser.feed(text)
+        text = "".join(parser.parts)
+    return text
+
+
+def chunk_text(text: str, size: int, overlap: int) -> List[str]:
+    """
+    Split text into chunks of at most `size` characters, each starting
+    `overlap` characters before the previous one ended. Cuts prefer a
+    paragraph, line, sentence or word boundary in the second half of a chunk.
+    """
+    text = text.strip()
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            for separator in ("\n\n", "\n", ". ", " "):
+                cut = text.rfind(separator, start + size // 2, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def extract_and_chunk(path: str, filename: str, content_type: str | None,
+                      size: int, overlap: int) -> List[str]:
+    return chunk_text(extract_text(Path(path), filename, content_type), size, overlap)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def ingest_key(sha256: str) -> str:
+    """Identifies a document's bytes plus the settings that shape its chunks and vectors."""
+    config = f"{INGEST_VERSION}:{sha256}:{settings.ingest_chunk_chars}:{settings.ingest_chunk_overlap}:{settings.embedding_model}"
+    return hashlib.sha256(config.encode()).hexdigest()
+
+
+class StageMetrics:
+    """Work done by one pipeline stage and the wall time spent in it."""
+
+    def __init__(self):
+        self.runs = 0
+        self.items = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def record(self, started: float, items: int, nbytes: int = 0) -> None:
+        self.runs += 1
+        self.items += items
+        self.bytes += nbytes
+        self.seconds += time.perf_counter() - started
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "runs": self.runs,
+            "items": self.items,
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 3),
+            "items_per_second": self.items / self.seconds if self.seconds else 0.0,
+            "bytes_per_second": self.bytes / self.seconds if self.seconds else 0.0,
+        }
+
+
+class IngestionPipeline:
+    """
+    Turns uploaded documents into embedded chunks in the background.
+
+    Stages: extract + chunk (process pool), embed (batched /api/embed calls,
+    bounded, skipping chunks whose vectors are cached), store (chunk rows)
+    and index (the project's vector index).
+    A document is only reprocessed when its bytes or the chunking/embedding
+    settings change, tracked by Document.ingest_key.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue | None = None
+        self._queued: Set[int] = set()
+        self._workers: List[asyncio.Task] = []
+        self._executor: ProcessPoolExecutor | None = None
+        self._embed_slots: asyncio.Semaphore | None = None
+        self.metrics = {stage: StageMetrics() for stage in ("extract", "embed", "store", "index")}
+        self.documents_ingested = 0
+        self.documents_failed = 0
+
+    def enqueue(self, document_id: int) -> None:
+        if self._queue is None or document_id in self._queued:
+            return
+        self._queued.add(document_id)
+        self._queue.put_nowait(document_id)
+
+    async def enqueue_pending(self, project_id: int | None = None) -> int:
+        """Queue documents that were never ingested or changed since; returns how many."""
+        query = select(Document.id, Document.sha256, Document.ingest_key)
+        if project_id is not None:
+            query = query.where(Document.project_id == project_id)
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(query)).all()
+        pending = [row.id for row in rows if row.ingest_key != ingest_key(row.sha256)]
+        for document_id in pending:
+            self.enqueue(document_id)
+        return len(pending)
+
+    async def _set_status(self, document_id: int, **values: Any) -> None:
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(Document).where(Document.id == document_id).values(**values))
+            await db.commit()
+
+    async def process(self, document_id: int) -> None:
+        async with AsyncSessionLocal() as db:
+            document = await db.get(Document, document_id)
+        if document is None:
+            return
+        key = ingest_key(document.sha256)
+        if document.ingest_key == key and document.ingest_status == "ready":
+            return
+
+        await self._set_status(document_id, ingest_status="processing", ingest_error=None)
+        try:
+            started = time.perf_counter()
+            chunks = await asyncio.get_running_loop().run_in_executor(
+                self._executor,
+                extract_and_chunk,
+                str(blob_store.path(document.sha256)),
+                document.filename,
+                document.content_type,
+                settings.ingest_chunk_chars,
+                settings.ingest_chunk_overlap,
+            )
+            self.metrics["extract"].record(started, len(chunks), document.size)
+
+            hashes = [content_hash(chunk) for chunk in chunks]
+            await self._embed(chunks, hashes)
+
+            started = time.perf_counter()
+            async with AsyncSessionLocal() as db:
+                old_ids = (await db.execute(
+                    select(DocumentChunk.id).where(DocumentChunk.document_id == document_id)
+                )).scalars().all()
+                await db.execute(delete(DocumentChunk).where(DocumentChunk.document_id == document_id))
+                rows = [
+                    DocumentChunk(document_id=document_id, chunk_index=i, content=chunk, content_hash=h)
+                    for i, (chunk, h) in enumerate(zip(chunks, hashes))
+                ]
+                db.add_all(rows)
+                await db.flush()
+                new_ids = [row.id for row in rows]
+                await db.commit()
+            self.metrics["store"].record(started, len(chunks))
+
+            started = time.perf_counter()
+            await self._index(document.project_id, old_ids, new_ids, hashes)
+            self.metrics["index"].record(started, len(new_ids))
+
+            # Only a searchable document counts as ingested; until then enqueue_pending retries it
+            await self._set_status(document_id, ingest_status="ready", ingest_key=key, chunk_count=len(chunks))
+            self.documents_ingested += 1
+        except Exception as e:
+            logger.warning("Ingesting document %s failed: %s", document_id, e)
+            self.documents_failed += 1
+            await self._set_status(document_id, ingest_status="failed", ingest_error=str(e) or type(e).__name__)
+
+    async def _index(self, project_id: int, old_ids: List[int], new_ids: List[int], hashes: List[str]) -> None:
+        """Swap a document's old chunk vectors for the new ones in the project index."""
+        packed = await embedding_cache.aget_many(settings.embedding_model, hashes)
+        vectors = np.stack([np.frombuffer(packed[h], dtype=np.float32) for h in hashes]) if hashes else None
+
+        def update_index():
+            vector_store.delete(project_id, old_ids)
+            if vectors is not None:
+                vector_store.add(project_id, new_ids, vectors, settings.embedding_model)
+
+        await asyncio.to_thread(update_index)
+
+    async def _embed(self, chunks: List[str], hashes: List[str]) -> None:
+        """Make sure every chunk's embedding is in the cache."""
+        model = settings.embedding_model
+        cached = await embedding_cache.aget_many(model, hashes)
+        missing: Dict[str, str] = {}
+        for chunk, h in zip(chunks, hashes):
+            if h not in cached:
+                missing.setdefault(h, chunk)
+        if not missing:
+            return
+
+        items = list(missing.items())
+        size = settings.ingest_embed_batch_size
+
+        async def embed_batch(batch):
+            async with self._embed_slots:
+                started = time.perf_counter()
+                vectors = await ollama_service.embed(model, [text for _, text in batch])
+                self.metrics["embed"].record(started, len(batch), sum(len(text) for _, text in batch))
+            await embedding_cache.aput_many(model, {h: pack(v) for (h, _), v in zip(batch, vectors)})
+
+        await asyncio.gather(*(embed_batch(items[i:i + size]) for i in range(0, len(items), size)))
+
+    async def _worker(self) -> None:
+        while True:
+            document_id = await self._queue.get()
+            self._queued.discard(document_id)
+            try:
+                await self.process(document_id)
+            except Exception:
+                logger.exception("Ingestion worker failed on document %s", document_id)
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._embed_slots = asyncio.Semaphore(settings.ingest_embed_concurrency)
+        # Not fork: this process already runs the event loop and worker threads holding locks
+        self._executor = ProcessPoolExecutor(
+            max_workers=settings.ingest_workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(settings.ingest_concurrency)]
+        try:
+            await self.enqueue_pending()
+        except Exception:
+            logger.exception("Could not queue pending documents")
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._queued.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._queued),
+            "documents_ingested": self.documents_ingested,
+            "documents_failed": self.documents_failed,
+            "stages": {stage: metrics.snapshot() for stage, metrics in self.metrics.items()},
+            "embedding_cache": embedding_cache.stats(),
+        }
+
+
+# Singleton instance
+ingestion_pipeline = IngestionPipeline()
@@ -1,16 +1,181 @@
+import asyncio
+import hashlib
+import time
+from collections import Counter, OrderedDict
 import httpx
-from typing import AsyncGenerator, Dict, Any, List
+from typing import AsyncGenerator, Callable, Dict, Any, List
+from app import metrics
 from app.config import settings
-import json
+from app.services.balancer import BackendPool, OllamaBackend
+from app.utils import fastjson
+from app.utils.ndjson import NDJSONDecoder
+
+# Fields of Ollama's final stream frame worth keeping (durations are in ns)
+STATS_FIELDS = (
+    "total_duration",
+    "load_duration",
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration",
+    "done_reason",
+)
+
+
+class LeaderAbandoned(RuntimeError):
+    """Raised to followers when the request leading a shared generation left before it started."""
+
+
+def keep_alive_for(model: str) -> str:
+    """How long Ollama should keep a model loaded after a request."""
+    return settings.model_keep_alive_overrides.get(model, settings.model_keep_alive)
+
+
+def _observe_final_frame(model: str, data: Dict[str, Any]) -> None:
+    """Record Ollama's timings (nanoseconds) from a final stream frame."""
+    if data.get("prompt_eval_duration"):
+        metrics.generation_prompt_eval_seconds.observe(data["prompt_eval_duration"] / 1e9, model)
+    eval_duration = data.get("eval_duration")
+    if eval_duration:
+        metrics.generation_eval_seconds.observe(eval_duration / 1e9, model)
+        if data.get("eval_count"):
+            metrics.generation_tokens_per_second.observe(data["eval_count"] / (eval_duration / 1e9), model)
+
+
+async def _frames(response: httpx.Response) -> AsyncGenerator[Dict[str, Any], None]:
+    """Decode an Ollama NDJSON response body frame by frame."""
+    decoder = NDJSONDecoder()
+    async for raw in response.aiter_bytes():
+        for data in decoder.feed(raw):
+            yield data
+    for data in decoder.close():
+        yield data
+
+
+class _Flight:
+    """One upstream generation shared by every identical concurrent request."""
+
+    def __init__(self, source: AsyncGenerator[str | Dict[str, Any], None]):
+        self.items: List[str | Dict[str, Any]] = []
+        self.error: BaseException | None = None
+        self.finished = False
+        self.subscribers = 0
+        self.ready: asyncio.Future | None = None  # Leader admission the upstream call waits for
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._drive(source))
+
+    def _notify(self) -> None:
+        # Swap in a fresh event so followers never miss a wakeup between clear and wait
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _drive(self, source) -> None:
+        try:
+            async for item in source:
+                self.items.append(item)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._notify()
+
+    async def follow(self) -> AsyncGenerator[str | Dict[str, Any], None]:
+        """Replay what was already emitted, then follow live output."""
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self.items):
+                yield self.items[position]
+                position += 1
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
 
 
 class OllamaService:
     """Service for interacting with Ollama API."""
-    
-    def __init__(self):
-        self.base_url = settings.ollama_base_url
+
+    def __init__(self, pool: BackendPool | None = None):
+        self.pool = pool or BackendPool.from_settings()
+        self.base_url = self.pool.primary.base_url
         self.timeout = settings.ollama_timeout
-    
+        self._flights: Dict[str, _Flight] = {}
+        self.coalesced_requests = 0
+        self.cancelled_generations = 0
+        self.tokens_saved = 0  # Upper bound: num_predict minus tokens emitted before cancelling
+        self.prompt_eval_tokens = 0
+        self.generating: Counter = Counter()  # (model, backend url) -> streams in flight
+        self._affinity: "OrderedDict[Any, str]" = OrderedDict()  # conversation -> backend url
+
+    async def startup(self) -> None:
+        """Probe backends once and start background health checks."""
+        await self.pool.probe_all()
+        await self.pool.start()
+
+    async def shutdown(self) -> None:
+        """Stop health checks and close every backend connection pool."""
+        await self.pool.close()
+
+    def _backend_for(self, backend_url: str | None) -> OllamaBackend:
+        if backend_url is None:
+            return self.pool.pick()
+        backend = self.pool.get(backend_url)
+        if backend is None:
+            raise ValueError(f"Unknown Ollama backend: {backend_url}")
+        return backend
+
+    def _pick(self, model: str, affinity_key: Any = None) -> OllamaBackend:
+        """Pick a backend, keeping a conversation on the node that holds its prompt cache."""
+        if affinity_key is None:
+            return self.pool.pick(model)
+        backend = self.pool.pick(model, prefer=self._affinity.get(affinity_key))
+        self._affinity[affinity_key] = backend.base_url
+        self._affinity.move_to_end(affinity_key)
+        while len(self._affinity) > settings.ollama_affinity_max_entries:
+            self._affinity.popitem(last=False)
+        return backend
+
+    def chat_payload(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2048,
+        system_prompt: str | None = None,
+        num_ctx: int | None = None,
+    ) -> Dict[str, Any]:
+        """Request body for a streaming /api/chat call."""
+        # System prompt first, then history as given: the prompt is byte-identical
+        # to the previous turn's up to the new message, so Ollama's KV cache applies.
+        # Never mutate the caller's list (it may be a cached history).
+        if system_prompt:
+            messages = [{"role": "system", "content": system_prompt}, *messages]
+
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": True,
+            "keep_alive": keep_alive_for(model),
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens,
+            }
+        }
+        if num_ctx:
+            payload["options"]["num_ctx"] = num_ctx
+        return payload
+
+    @staticmethod
+    def coalescible(payload: Dict[str, Any]) -> bool:
+        """Deterministic requests, which identical concurrent requests may share."""
+        return settings.ollama_coalesce_requests and payload["options"]["temperature"] == 0
+
     async def generate_stream(
         self,
         model: str,
@@ -18,97 +183,280 @@ class OllamaService:
         temperature: float = 0.7,
         max_tokens: int = 2048,
         system_prompt: str | None = None,
+        num_ctx: int | None = None,
+        stats: Dict[str, Any] | None = None,
+        affinity_key: Any = None,
     ) -> AsyncGenerator[str, None]:
         """
         Generate streaming response from Ollama.
-        
+
         Args:
             model: Model name (e.g., 'llama2', 'mistral')
             messages: List of message dicts with 'role' and 'content'
             temperature: Sampling temperature
             max_tokens: Max tokens to generate
             system_prompt: Optional system prompt
-        
+            num_ctx: Context window size to request (model default if None)
+            stats: Optional dict filled with the final frame's timing and token counts
+            affinity_key: Routes calls with the same key (e.g. a conversation id)
+                to the same backend so Ollama can reuse the cached prompt prefix
+
         Yields:
             Chunks of generated text
         """
-        url = f"{self.base_url}/api/chat"
-        
-        # Build request payload
+        payload = self.chat_payload(model, messages, temperature, max_tokens, system_prompt, num_ctx)
+        if self.coalescible(payload):
+            # Deterministic: identical in-flight requests share one generation
+            stream = self.join(payload) or self.lead(payload, affinity_key=affinity_key)
+        else:
+            stream = self._stream_chat(payload, affinity_key)
+        async for chunk in self.texts(stream, stats):
+            yield chunk
+
+    async def texts(
+        self, stream: AsyncGenerator[str | Dict[str, Any], None], stats: Dict[str, Any] | None = None
+    ) -> AsyncGenerator[str, None]:
+        """Text chunks of a chat stream, copying the final stats dict into `stats`."""
+        async for chunk in stream:
+            if isinstance(chunk, dict):
+                if stats is not None:
+                    stats.update(chunk)
+            else:
+                yield chunk
+
+    def stream_payload(
+        self, payload: Dict[str, Any], affinity_key: Any = None
+    ) -> AsyncGenerator[str | Dict[str, Any], None]:
+        """Run a chat_payload upstream without coalescing; pass through texts()."""
+        return self._stream_chat(payload, affinity_key)
+
+    async def _stream_chat(
+        self, payload: Dict[str, Any], affinity_key: Any = None
+    ) -> AsyncGenerator[str | Dict[str, Any], None]:
+        """Run one upstream chat stream, yielding text chunks then the final stats dict."""
+        model = payload["model"]
+        backend = self._pick(model, affinity_key)
+        backend.in_flight += 1
+        self.generating[(model, backend.base_url)] += 1
+        emitted = 0
+        started = time.perf_counter()
+        try:
+            async with backend.client.stream("POST", "/api/chat", json=payload) as response:
+                response.raise_for_status()
+
+                async for data in _frames(response):
+                    message = data.get("message")
+                    if message:
+                        chunk = message.get("content")
+                        if chunk:
+                            if not emitted:
+                                metrics.generation_ttft_seconds.observe(time.perf_counter() - started, model)
+                            emitted += 1
+                            yield chunk
+                    if data.get("done"):
+                        # With a reused prefix, prompt_eval_count covers only the new tokens
+                        self.prompt_eval_tokens += data.get("prompt_eval_count", 0)
+                        _observe_final_frame(model, data)
+                        final = {k: data[k] for k in STATS_FIELDS if k in data}
+                        final["backend"] = backend.base_url
+                        yield final
+            backend.mark_success()
+        except httpx.TransportError:
+            # Connection-level failures count against the node's health
+            backend.mark_failure()
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            # Closing the stream drops the connection, which stops Ollama generating.
+            # Ollama streams roughly one token per chunk, so the rest of num_predict is saved.
+            self.cancelled_generations += 1
+            self.tokens_saved += max(0, payload["options"].get("num_predict", 0) - emitted)
+            raise
+        finally:
+            backend.in_flight -= 1
+            self.generating[(model, backend.base_url)] -= 1
+
+    def _forget(self, key: str, flight: "_Flight") -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    @staticmethod
+    def _flight_key(payload: Dict[str, Any]) -> str:
+        return hashlib.sha256(fastjson.dumps(payload)).hexdigest()
+
+    def join(self, payload: Dict[str, Any]) -> AsyncGenerator[str | Dict[str, Any], None] | None:
+        """Follow an identical in-flight generation, or None if there is none."""
+        key = self._flight_key(payload)
+        flight = self._flights.get(key)
+        if flight is None or flight.finished:
+            return None
+        self.coalesced_requests += 1
+        return self._subscribe(key, flight)
+
+    def lead(
+        self,
+        payload: Dict[str, Any],
+        ready: asyncio.Future | None = None,
+        affinity_key: Any = None,
+        on_done: Callable[[], None] | None = None,
+    ) -> AsyncGenerator[str | Dict[str, Any], None]:
+        """
+        Start a generation that identical requests can join(), returning the
+        leader's stream. It is registered immediately, so followers can attach
+        while the leader still waits for a slot; the upstream call starts once
+        `ready` resolves (at once if None), and fails for everyone if it errors.
+        A leader that leaves before its slot is granted sets LeaderAbandoned on
+        `ready`; followers then see that error and should start over (join or
+        lead again). `on_done` runs when the shared generation ends, however it ends.
+        """
+        key = self._flight_key(payload)
+
+        async def source():
+            if ready is not None:
+                await ready
+            async for item in self._stream_chat(payload, affinity_key):
+                yield item
+
+        flight = _Flight(source())
+        flight.ready = ready
+        self._flights[key] = flight
+        flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        if on_done is not None:
+            flight.task.add_done_callback(lambda _: on_done())
+        return self._subscribe(key, flight)
+
+    async def _subscribe(self, key: str, flight: _Flight) -> AsyncGenerator[str | Dict[str, Any], None]:
+        flight.subscribers += 1
+        try:
+            async for item in flight.follow():
+                yield item
+        finally:
+            flight.subscribers -= 1
+            started = flight.ready is None or flight.ready.done()
+            if flight.subscribers == 0 and started and not flight.task.done():
+                # Last listener left: stop burning inference on it
+                # (a leader still queued for its slot is not listening yet)
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    async def complete(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2048,
+    ) -> str:
+        """Generate a full (non-streaming) chat response."""
         payload = {
             "model": model,
             "messages": messages,
-            "stream": True,
+            "stream": False,
+            "keep_alive": keep_alive_for(model),
             "options": {
                 "temperature": temperature,
                 "num_predict": max_tokens,
             }
         }
-        
-        # Add system message if provided
-        if system_prompt:
-            payload["messages"].insert(0, {
-                "role": "system",
-                "content": system_prompt
-            })
-        
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            async with client.stream("POST", url, json=payload) as response:
-                response.raise_for_status()
-                
-                async for line in response.aiter_lines():
-                    if line:
-                        try:
-                            data = json.loads(line)
-                            if "message" in data and "content" in data["message"]:
-                                chunk = data["message"]["content"]
-                                if chunk:
-                                    yield chunk
-                        except json.JSONDecodeError:
-                            continue
-    
+
+        backend = self.pool.pick(model)
+        backend.in_flight += 1
+        try:
+            response = await backend.client.post("/api/chat", json=payload)
+            response.raise_for_status()
+            backend.mark_success()
+        except httpx.TransportError:
+            backend.mark_failure()
+            raise
+        finally:
+            backend.in_flight -= 1
+        return response.json().get("message", {}).get("content", "")
+
+    async def embed(self, model: str, inputs: List[str]) -> List[List[float]]:
+        """Embed a batch of texts with Ollama's /api/embed, one vector per input."""
+        payload = {"model": model, "input": inputs, "keep_alive": keep_alive_for(model)}
+
+        backend = self.pool.pick(model)
+        backend.in_flight += 1
+        try:
+            response = await backend.client.post("/api/embed", json=payload)
+            response.raise_for_status()
+            backend.mark_success()
+        except httpx.TransportError:
+            backend.mark_failure()
+            raise
+        finally:
+            backend.in_flight -= 1
+        embeddings = response.json().get("embeddings", [])
+        if len(embeddings) != len(inputs):
+            raise ValueError(f"Expected {len(inputs)} embeddings, got {len(embeddings)}")
+        return embeddings
+
     async def list_models(self) -> List[Dict[str, Any]]:
         """List available Ollama models."""
-        url = f"{self.base_url}/api/tags"
-        
-        async with httpx.AsyncClient(timeout=30) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
-            return data.get("models", [])
-    
-    async def pull_model(self, model_name: str) -> AsyncGenerator[Dict[str, Any], None]:
+        backend = self.pool.pick()
+        response = await backend.client.get("/api/tags", timeout=settings.ollama_list_timeout)
+        response.raise_for_status()
+        data = response.json()
+        return data.get("models", [])
+
+    async def pull_model(
+        self, model_name: str, backend_url: str | None = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
         """
         Pull/download a model from Ollama.
-        
+
         Args:
             model_name: Name of model to pull
-            
+            backend_url: Backend to pull onto (defaults to the least-loaded node)
+
         Yields:
             Progress updates as dicts
         """
-        url = f"{self.base_url}/api/pull"
         payload = {"name": model_name, "stream": True}
-        
-        async with httpx.AsyncClient(timeout=3600) as client:  # 1 hour timeout for downloads
-            async with client.stream("POST", url, json=payload) as response:
-                response.raise_for_status()
-                
-                async for line in response.aiter_lines():
-                    if line:
-                        try:
-                            yield json.loads(line)
-                        except json.JSONDecodeError:
-                            continue
-    
+        backend = self._backend_for(backend_url)
+
+        async with backend.client.stream(
+            "POST", "/api/pull", json=payload, timeout=settings.ollama_pull_timeout
+        ) as response:
+            response.raise_for_status()
+
+            async for data in _frames(response):
+                if data.get("status") == "success":
+                    backend.available_models.add(model_name)
+                yield data
+
     async def delete_model(self, model_name: str) -> bool:
-        """Delete a model from Ollama."""
-        url = f"{self.base_url}/api/delete"
+        """Delete a model from every healthy Ollama backend."""
         payload = {"name": model_name}
-        
-        async with httpx.AsyncClient(timeout=30) as client:
-            response = await client.delete(url, json=payload)
-            return response.status_code == 200
+        deleted = False
+
+        for backend in self.pool.healthy_backends():
+            try:
+                response = await backend.client.request(
+                    "DELETE", "/api/delete", json=payload, timeout=settings.ollama_list_timeout
+                )
+            except httpx.TransportError:
+                backend.mark_failure()
+                continue
+            if response.status_code == 200:
+                backend.available_models.discard(model_name)
+                backend.loaded_models.discard(model_name)
+                deleted = True
+        return deleted
+
+    def generation_stats(self) -> Dict[str, int]:
+        """Counters for coalesced and abandoned generations."""
+        return {
+            "in_flight": sum(b.in_flight for b in self.pool.backends),
+            "coalesced_requests": self.coalesced_requests,
+            "cancelled_generations": self.cancelled_generations,
+            "tokens_saved": self.tokens_saved,
+            "prompt_eval_tokens": self.prompt_eval_tokens,
+            "pinned_conversations": len(self._affinity),
+        }
+
+    def backend_status(self) -> List[Dict[str, Any]]:
+        """Health and load snapshot for every configured backend."""
+        return [backend.status() for backend in self.pool.backends]
 
 
 # Singleton instance
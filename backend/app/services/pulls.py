@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncGenerator, Dict, List
+from app.config import settings
+from app.services.catalog import model_catalog
+from app.services.ollama import ollama_service
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ("completed", "failed", "cancelled")
+
+
+class PullJob:
+    """A model download running in the background, with its latest progress."""
+
+    def __init__(self, model: str, backend_url: str | None):
+        self.id = uuid.uuid4().hex
+        self.model = model
+        self.backend_url = backend_url
+        self.state = "queued"  # queued, downloading, completed, failed or cancelled
+        self.status: str | None = None  # Ollama's last status line
+        self.digest: str | None = None
+        self.total: int | None = None
+        self.completed: int | None = None
+        self.error: str | None = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: datetime | None = None
+        self.task: asyncio.Task | None = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def update(self, **fields: Any) -> None:
+        for key, value in fields.items():
+            setattr(self, key, value)
+        if self.finished:
+            self.finished_at = datetime.utcnow()
+        self._notify()
+
+    async def follow(self) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yield a snapshot now and after every change until the pull finishes."""
+        while True:
+            changed = self._changed
+            yield self.snapshot()
+            if self.finished:
+                return
+            await changed.wait()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "model": self.model,
+            "backend_url": self.backend_url,
+            "state": self.state,
+            "status": self.status,
+            "digest": self.digest,
+            "total": self.total,
+            "completed": self.completed,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class PullManager:
+    """
+    Runs model pulls as background jobs.
+
+    A pull of a model that is already queued or downloading returns the
+    existing job instead of starting a second download, and at most
+    model_pull_max_concurrent downloads run at once so pulls leave bandwidth
+    for live inference. Finished jobs are kept for a while for polling.
+    """
+
+    def __init__(self):
+        self.jobs: "OrderedDict[str, PullJob]" = OrderedDict()
+        self._active: Dict[tuple, PullJob] = {}
+        self._slots: asyncio.Semaphore | None = None
+
+    def start_pull(self, model: str, backend_url: str | None = None) -> PullJob:
+        """Start or join a pull; without a backend_url the least-loaded node is picked now."""
+        # Key on the node that will actually download, so implicit and explicit pulls dedupe
+        backend = ollama_service.pool.pick() if backend_url is None else ollama_service.pool.get(backend_url)
+        if backend is None:
+            raise ValueError(f"Unknown Ollama backend: {backend_url}")
+        backend_url = backend.base_url
+        key = (model, backend_url)
+        job = self._active.get(key)
+        if job is not None:
+            return job
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(settings.model_pull_max_concurrent)
+        job = PullJob(model, backend_url)
+        self.jobs[job.id] = job
+        self._active[key] = job
+        job.task = asyncio.create_task(self._run(job))
+        self._trim()
+        return job
+
+    def get(self, job_id: str) -> PullJob | None:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job: PullJob) -> None:
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+
+    async def _run(self, job: PullJob) -> None:
+        try:
+            async with self._slots:
+                job.update(state="downloading")
+                async for progress in ollama_service.pull_model(job.model, job.backend_url):
+                    if progress.get("error"):
+                        job.update(state="failed", error=progress["error"])
+                        return
+                    job.update(
+                        status=progress.get("status"),
+                        digest=progress.get("digest", job.digest),
+                        total=progress.get("total", job.total),
+                        completed=progress.get("completed", job.completed),
+                    )
+                job.update(state="completed")
+                model_catalog.invalidate()
+        except asyncio.CancelledError:
+            # Dropping the stream stops the download; Ollama resumes it on the next pull
+            job.update(state="cancelled")
+        except Exception as e:
+            logger.warning("Pull of %s failed: %s", job.model, e)
+            job.update(state="failed", error=str(e) or type(e).__name__)
+        finally:
+            self._active.pop((job.model, job.backend_url), None)
+
+    def _trim(self) -> None:
+        """Forget the oldest finished jobs beyond the history limit."""
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - settings.model_pull_history)]:
+            del self.jobs[job_id]
+
+    async def stop(self) -> None:
+        running = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [job.snapshot() for job in self.jobs.values()]
+
+
+# Singleton instance
+pull_manager = PullManager()
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Set
+import httpx
+from sqlalchemy import func, select
+from app.config import settings
+from app.database import AsyncSessionLocal, Agent, Conversation, Project
+from app.services.balancer import NoBackendAvailable
+from app.services.ollama import keep_alive_for, ollama_service
+from app.services.scheduler import generation_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class ModelResidencyManager:
+    """
+    Keeps the models behind recently used agents loaded in Ollama.
+
+    Residency comes from the backend pool's /api/ps probes. A periodic pass
+    preloads the models of agents that have conversations in recently
+    accessed projects, and opening a project preloads its agents' models
+    right away, so the user's first token does not pay the model load.
+    Preloads bypass the generation scheduler, so they are skipped while
+    requests are queued for a slot: a load would evict a model that waiting
+    work needs and compete with it for the backend.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loading: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.preloads = 0
+
+    def is_warm(self, model: str) -> bool:
+        return any(b.has_loaded(model) for b in ollama_service.pool.healthy_backends())
+
+    def status(self, model: str) -> str:
+        if self.is_warm(model):
+            return "warm"
+        if model in self._loading:
+            return "loading"
+        return "cold"
+
+    async def preload(self, model: str) -> bool:
+        """Load a model on the best backend for it, if it is not resident anywhere."""
+        if self.is_warm(model) or model in self._loading:
+            return False
+        if generation_scheduler.queued_total:
+            logger.debug("Skipping preload of %s: generation requests are queued", model)
+            return False
+        self._loading.add(model)
+        try:
+            backend = ollama_service.pool.pick(model)
+            # An empty generate request makes Ollama load the model and return
+            response = await backend.client.post(
+                "/api/generate",
+                json={"model": model, "keep_alive": keep_alive_for(model)},
+                timeout=settings.model_preload_timeout,
+            )
+            response.raise_for_status()
+            backend.loaded_models.add(model)
+            self.preloads += 1
+            return True
+        except (httpx.HTTPError, NoBackendAvailable) as e:
+            logger.warning("Preloading %s failed: %s", model, e)
+            return False
+        finally:
+            self._loading.discard(model)
+
+    async def recent_models(self, project_id: int | None = None) -> List[str]:
+        """Models of agents used in recently accessed projects, most recent first."""
+        query = (
+            select(Agent.base_model, func.max(Project.last_accessed).label("accessed"))
+            .join(Conversation, Conversation.agent_id == Agent.id)
+            .join(Project, Project.id == Conversation.project_id)
+            .group_by(Agent.base_model)
+            .order_by(func.max(Project.last_accessed).desc())
+            .limit(settings.model_preload_max)
+        )
+        if project_id is not None:
+            query = query.where(Project.id == project_id)
+        else:
+            cutoff = datetime.utcnow() - timedelta(seconds=settings.model_preload_window)
+            query = query.where(Project.last_accessed >= cutoff)
+
+        async with AsyncSessionLocal() as db:
+            return [row.base_model for row in await db.execute(query)]
+
+    async def preload_recent(self, project_id: int | None = None) -> None:
+        for model in await self.recent_models(project_id):
+            await self.preload(model)
+
+    def request_preload(self, project_id: int) -> None:
+        """Warm a project's models in the background; safe to call from sync routes."""
+        if self._loop is None:
+            return
+
+        def schedule():
+            task = asyncio.create_task(self.preload_recent(project_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        self._loop.call_soon_threadsafe(schedule)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.preload_recent()
+            except Exception:
+                logger.exception("Model preload pass failed")
+            await asyncio.sleep(settings.model_preload_interval)
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        if self._task is None and settings.model_preload_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+
+    def stats(self) -> Dict:
+        loaded = {
+            b.base_url: sorted(b.loaded_models) for b in ollama_service.pool.backends
+        }
+        return {"loaded": loaded, "loading": sorted(self._loading), "preloads": self.preloads}
+
+
+# Singleton instance
+residency_manager = ModelResidencyManager()
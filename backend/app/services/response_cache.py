@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+from app.config import settings
+from app.utils import fastjson
+
+
+class ResponseCache:
+    """
+    On-disk cache of assistant answers for deterministic (temperature 0) agents.
+
+    Entries live in a small SQLite file keyed by a hash of everything sent to
+    Ollama, and are evicted by TTL and least-recent use once the store grows
+    past its byte budget. Blocking I/O runs in a worker thread.
+    """
+
+    def __init__(self, path: Path, max_bytes: int, ttl: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, system_prompt: str | None, options: Dict[str, Any],
+            messages: List[Dict[str, str]]) -> str:
+        """Stable hash of a generation request."""
+        payload = fastjson.dumps({
+            "model": model,
+            "system": system_prompt or "",
+            "options": dict(sorted(options.items())),
+            "messages": [[m["role"], m["content"]] for m in messages],
+        })
+        return hashlib.sha256(payload).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_accessed ON responses (accessed_at)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT content, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    conn.commit()
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, content: str) -> None:
+        size = len(content.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, content, size, now, now),
+            )
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Drop least recently used entries until under 90% of the budget."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        for key, size in conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ).fetchall():
+            if total <= target:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    async def aget(self, key: str) -> str | None:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, content: str) -> None:
+        await asyncio.to_thread(self.put, key, content)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total = (0, 0)
+            if self._conn is not None:
+                entries, total = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": settings.response_cache_enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def is_cacheable(temperature: float | None) -> bool:
+    """Only deterministic generations are safe to replay."""
+    return settings.response_cache_enabled and temperature == 0
+
+
+# Singleton instance
+response_cache = ResponseCache(
+    settings.response_cache_path,
+    settings.response_cache_max_bytes,
+    settings.response_cache_ttl,
+)
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List
+import numpy as np
+from sqlalchemy import select
+from app.config import settings
+from app.database import AsyncSessionLocal, Document, DocumentChunk
+from app.services.ollama import ollama_service
+from app.services.vectors import vector_store
+
+logger = logging.getLogger(__name__)
+
+
+class Retriever:
+    """
+    Finds project document chunks relevant to a chat message.
+
+    Retrieval runs under rag_latency_budget: embedding the query, searching
+    the project's vector index and loading the chunk text either finish in
+    time or the turn goes ahead without document context.
+    """
+
+    def __init__(self):
+        self.retrievals = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    async def context_for(self, project_id: int, query: str) -> str | None:
+        """A system message body with the best matching excerpts, or None."""
+        if not settings.rag_enabled or not vector_store.has_vectors(project_id):
+            return None
+        started = time.perf_counter()
+        try:
+            chunks = await asyncio.wait_for(self.search(project_id, query), settings.rag_latency_budget)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+        except Exception as e:
+            logger.warning("Retrieval for project %s failed: %s", project_id, e)
+            self.errors += 1
+            return None
+        finally:
+            self.seconds += time.perf_counter() - started
+        self.retrievals += 1
+        return format_context(chunks)
+
+    async def search(self, project_id: int, query: str) -> List[Dict[str, Any]]:
+        """Top chunks above rag_min_score, best first."""
+        vector = (await ollama_service.embed(settings.embedding_model, [query]))[0]
+        hits = await asyncio.to_thread(
+            vector_store.search, project_id, np.asarray(vector, dtype=np.float32), settings.rag_top_k,
+            settings.embedding_model,
+        )
+        scores = {chunk_id: score for chunk_id, score in hits if score >= settings.rag_min_score}
+        if not scores:
+            return []
+
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(DocumentChunk.id, DocumentChunk.content, Document.filename)
+                .join(Document, Document.id == DocumentChunk.document_id)
+                .where(DocumentChunk.id.in_(scores))
+            )).all()
+        chunks = [
+            {"id": row.id, "filename": row.filename, "content": row.content, "score": scores[row.id]}
+            for row in rows
+        ]
+        return sorted(chunks, key=lambda c: c["score"], reverse=True)
+
+    def stats(self) -> Dict[str, Any]:
+        attempts = self.retrievals + self.timeouts + self.errors
+        return {
+            "retrievals": self.retrievals,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "mean_seconds": self.seconds / attempts if attempts else 0.0,
+        }
+
+
+def format_context(chunks: List[Dict[str, Any]]) -> str | None:
+    parts = []
+    used = 0
+    for chunk in chunks:
+        part = f"[{chunk['filename']}]\n{chunk['content']}"
+        if parts and used + len(part) > settings.rag_max_chars:
+            break
+        parts.append(part[:settings.rag_max_chars])
+        used += len(part)
+    if not parts:
+        return None
+    return "Relevant excerpts from the project's documents:\n\n" + "\n\n".join(parts)
+
+
+# Singleton instance
+retriever = Retriever()
@@ -0,0 +1,289 @@
+import asyncio
+import itertools
+import math
+import time
+from collections import OrderedDict, deque
+from typing import AsyncGenerator, Callable, Deque, Dict
+from app import metrics
+from app.config import settings
+from app.services.ollama import ollama_service
+
+
+class QueueFull(Exception):
+    """Raised when a generation cannot be queued."""
+
+    def __init__(self, scope: str, retry_after: int):
+        super().__init__(f"Generation queue is full ({scope})")
+        self.scope = scope  # 'project' or 'total'
+        self.retry_after = retry_after
+
+
+class QueueTimeout(Exception):
+    """Raised when a queued generation waits longer than allowed."""
+
+
+class Ticket:
+    """A generation slot request, granted once capacity frees up."""
+
+    def __init__(self, scheduler: "GenerationScheduler", model: str, project_id: int, seq: int,
+                 background: bool = False):
+        self.scheduler = scheduler
+        self.model = model
+        self.project_id = project_id
+        self.seq = seq
+        self.background = background
+        self.enqueued_at = time.monotonic()
+        self.granted_at: float | None = None
+        self.released = False
+        self._granted: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._changed = asyncio.Event()
+
+    @property
+    def granted(self) -> bool:
+        return self._granted.done()
+
+    @property
+    def wait_time(self) -> float:
+        end = self.granted_at if self.granted_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+    async def wait(self) -> AsyncGenerator[int, None]:
+        """
+        Wait for a slot, yielding the queue position whenever it changes.
+
+        Returns without yielding if the slot was granted immediately.
+        Background tickets wait as long as it takes.
+        """
+        deadline = math.inf if self.background else time.monotonic() + settings.scheduler_queue_timeout
+        last_position = None
+        while not self.granted:
+            position = self.scheduler.position(self)
+            if position != last_position:
+                last_position = position
+                yield position
+            self._changed.clear()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.release()
+                raise QueueTimeout("Timed out waiting for a free generation slot")
+            changed = asyncio.ensure_future(self._changed.wait())
+            try:
+                await asyncio.wait({self._granted, changed},
+                                   timeout=None if remaining == math.inf else remaining,
+                                   return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                changed.cancel()
+
+    def release(self) -> None:
+        """Give the slot back, or leave the queue if it was never granted."""
+        self.scheduler.release(self)
+
+
+class GenerationScheduler:
+    """
+    Admission control in front of Ollama generations.
+
+    Each model gets a concurrency limit per healthy backend serving it, and
+    all models share a global cap that scales with the number of healthy
+    backends. Waiting requests are queued per project and served round-robin
+    across projects so one busy project cannot starve the others.
+
+    Background work (batch jobs, conversation summaries) is a lower priority
+    class: it queues separately without counting against the interactive
+    queue limits, only gets a slot when no interactive request for the model
+    is waiting, and holds at most scheduler_max_background_per_model slots
+    per model.
+    """
+
+    def __init__(self, capacity: Callable[[], int], model_backends: Callable[[str], int] = lambda model: 1):
+        self._capacity = capacity
+        self._model_backends = model_backends
+        self._seq = itertools.count()
+        self._active: Dict[str, int] = {}
+        self._total_active = 0
+        # model -> project_id -> FIFO of waiting tickets (project order is the rotation)
+        self._queues: Dict[str, "OrderedDict[int, Deque[Ticket]]"] = {}
+        self._queued_total = 0
+        self._background: Dict[str, Deque[Ticket]] = {}  # model -> FIFO of background tickets
+        self._active_background: Dict[str, int] = {}
+        self._avg_duration: Dict[str, float] = {}
+
+    def _queued_for_project(self, project_id: int) -> int:
+        return sum(len(projects.get(project_id, ())) for projects in self._queues.values())
+
+    def _retry_after(self, model: str) -> int:
+        avg = self._avg_duration.get(model, settings.scheduler_default_retry_after)
+        limit = max(1, self._model_limit(model))
+        queued = sum(len(q) for q in self._queues.get(model, {}).values())
+        return max(1, min(60, math.ceil(avg * (queued + 1) / limit)))
+
+    def _model_limit(self, model: str) -> int:
+        return settings.scheduler_max_concurrent_per_model * max(1, self._model_backends(model))
+
+    def _has_capacity(self, model: str) -> bool:
+        return (
+            self._active.get(model, 0) < self._model_limit(model)
+            and self._total_active < self._capacity()
+        )
+
+    def _background_may_run(self, model: str) -> bool:
+        return (
+            not self._queues.get(model)
+            and self._active_background.get(model, 0) < settings.scheduler_max_background_per_model
+            and self._has_capacity(model)
+        )
+
+    def _grant(self, ticket: Ticket) -> None:
+        if ticket.background:
+            self._active_background[ticket.model] = self._active_background.get(ticket.model, 0) + 1
+        self._active[ticket.model] = self._active.get(ticket.model, 0) + 1
+        self._total_active += 1
+        ticket.granted_at = time.monotonic()
+        ticket._granted.set_result(True)
+        metrics.queue_wait_seconds.observe(ticket.wait_time, ticket.model)
+
+    def submit(self, model: str, project_id: int, background: bool = False) -> Ticket:
+        """
+        Grant a slot now or enqueue; raises QueueFull when over the limits.
+        Background tickets are never refused, only queued behind interactive ones.
+        """
+        ticket = Ticket(self, model, project_id, next(self._seq), background)
+        if background:
+            if not self._background.get(model) and self._background_may_run(model):
+                self._grant(ticket)
+            else:
+                self._background.setdefault(model, deque()).append(ticket)
+            return ticket
+
+        if not self._queues.get(model) and self._has_capacity(model):
+            self._grant(ticket)
+            return ticket
+
+        if self._queued_for_project(project_id) >= settings.scheduler_max_queue_per_project:
+            raise QueueFull("project", self._retry_after(model))
+        if self._queued_total >= settings.scheduler_max_queue_total:
+            raise QueueFull("total", self._retry_after(model))
+
+        projects = self._queues.setdefault(model, OrderedDict())
+        projects.setdefault(project_id, deque()).append(ticket)
+        self._queued_total += 1
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        if ticket.released:
+            return
+        ticket.released = True
+
+        if ticket.granted:
+            self._active[ticket.model] -= 1
+            self._total_active -= 1
+            if ticket.background:
+                self._active_background[ticket.model] -= 1
+            duration = time.monotonic() - ticket.granted_at
+            prev = self._avg_duration.get(ticket.model, duration)
+            self._avg_duration[ticket.model] = 0.8 * prev + 0.2 * duration
+        elif ticket.background:
+            queue = self._background.get(ticket.model)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._background[ticket.model]
+        else:
+            projects = self._queues.get(ticket.model, {})
+            queue = projects.get(ticket.project_id)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                self._queued_total -= 1
+                if not queue:
+                    del projects[ticket.project_id]
+            self._notify(ticket.model)
+
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiting tickets, rotating across projects."""
+        for model in list(self._queues):
+            projects = self._queues[model]
+            granted_any = False
+            while projects and self._has_capacity(model):
+                project_id, queue = next(iter(projects.items()))
+                self._grant(queue.popleft())
+                self._queued_total -= 1
+                granted_any = True
+                # Move the project to the back of the rotation
+                del projects[project_id]
+                if queue:
+                    projects[project_id] = queue
+            if not projects:
+                del self._queues[model]
+            if granted_any:
+                self._notify(model)
+
+        # Background work takes what interactive requests left free
+        for model in list(self._background):
+            queue = self._background[model]
+            while queue and self._background_may_run(model):
+                self._grant(queue.popleft())
+            if not queue:
+                del self._background[model]
+
+    def _notify(self, model: str) -> None:
+        for queue in self._queues.get(model, {}).values():
+            for waiting in queue:
+                waiting._changed.set()
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based position under round-robin service across projects."""
+        if ticket.background:
+            queue = self._background.get(ticket.model, ())
+            if ticket not in queue:
+                return 0
+            interactive = sum(len(q) for q in self._queues.get(ticket.model, {}).values())
+            return interactive + list(queue).index(ticket) + 1
+        projects = self._queues.get(ticket.model)
+        if not projects or ticket.project_id not in projects:
+            return 0
+        order = list(projects)
+        own_index = order.index(ticket.project_id)
+        depth = projects[ticket.project_id].index(ticket)
+        ahead = depth
+        for i, project_id in enumerate(order):
+            if project_id == ticket.project_id:
+                continue
+            per_round = depth + 1 if i < own_index else depth
+            ahead += min(len(projects[project_id]), per_round)
+        return ahead + 1
+
+    @property
+    def queued_total(self) -> int:
+        """Interactive requests waiting for a slot."""
+        return self._queued_total
+
+    def stats(self) -> Dict:
+        return {
+            "capacity": self._capacity(),
+            "active_total": self._total_active,
+            "active_by_model": {m: n for m, n in self._active.items() if n},
+            "queued_total": self._queued_total,
+            "queued_by_model": {
+                m: sum(len(q) for q in projects.values())
+                for m, projects in self._queues.items()
+            },
+            "active_background_by_model": {m: n for m, n in self._active_background.items() if n},
+            "queued_background_by_model": {m: len(q) for m, q in self._background.items()},
+        }
+
+
+def _backend_capacity() -> int:
+    healthy = len(ollama_service.pool.healthy_backends())
+    return max(1, healthy) * settings.scheduler_max_concurrent_per_backend
+
+
+def _model_backends(model: str) -> int:
+    # Same fallback as BackendPool.pick: if no node lists the model, any healthy node may serve it
+    healthy = ollama_service.pool.healthy_backends()
+    return sum(1 for b in healthy if b.has_model(model)) or len(healthy)
+
+
+# Singleton instance
+generation_scheduler = GenerationScheduler(_backend_capacity, _model_backends)
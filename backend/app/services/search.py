@@ -0,0 +1,68 @@
+from typing import Any, Dict, List, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.config import settings
+
+HIGHLIGHT = "**"
+
+
+def fts_query(query: str) -> str | None:
+    """
+    Turn free text into an FTS5 query that cannot be a syntax error.
+
+    Each word is quoted as a literal term and all terms must match; a
+    trailing * keeps prefix matching (e.g. "deploy*"). Returns None when
+    nothing searchable is left.
+    """
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', "")
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms) or None
+
+
+def search_messages(
+    db: Session,
+    query: str,
+    project_id: int | None = None,
+    agent_id: int | None = None,
+    limit: int = 20,
+    after: Tuple[float, int] | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Messages matching an FTS5 query, best match first (bm25, then id).
+
+    `after` is the (rank, id) of the last row of the previous page. Returns
+    up to `limit` rows with a highlighted snippet of each message.
+    """
+    conditions = ["messages_fts MATCH :query"]
+    params: Dict[str, Any] = {
+        "query": query,
+        "limit": limit,
+        "highlight": HIGHLIGHT,
+        "tokens": settings.search_snippet_tokens,
+    }
+    if project_id is not None:
+        conditions.append("c.project_id = :project_id")
+        params["project_id"] = project_id
+    if agent_id is not None:
+        conditions.append("c.agent_id = :agent_id")
+        params["agent_id"] = agent_id
+    if after is not None:
+        conditions.append("(messages_fts.rank > :rank OR (messages_fts.rank = :rank AND m.id > :after_id))")
+        params["rank"], params["after_id"] = after
+
+    sql = f"""
+        SELECT m.id, m.conversation_id, c.project_id, c.agent_id, m.role, m.created_at,
+               snippet(messages_fts, 0, :highlight, :highlight, '…', :tokens) AS snippet,
+               messages_fts.rank AS rank
+        FROM messages_fts
+        JOIN messages m ON m.id = messages_fts.rowid
+        JOIN conversations c ON c.id = m.conversation_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY messages_fts.rank, m.id
+        LIMIT :limit
+    """
+    return [dict(row._mapping) for row in db.execute(text(sql), params)]
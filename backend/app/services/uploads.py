@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, Tuple
+from app.config import settings
+from app.database import Document, SessionLocal
+from app.utils import fastjson
+
+
+class UploadError(ValueError):
+    """Raised for an upload that cannot be accepted."""
+
+
+class UploadTooLarge(UploadError):
+    """Raised when an upload exceeds max_upload_size or its declared size."""
+
+
+class OffsetMismatch(UploadError):
+    """Raised when a chunk does not start where the stored upload ends."""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+
+class ChecksumMismatch(UploadError):
+    """Raised when the stored bytes do not match the declared sha256."""
+
+
+async def rechunk(stream: AsyncIterator[bytes], size: int) -> AsyncIterator[bytes]:
+    """Regroup an arbitrary byte stream into chunks of `size` bytes (the last may be short)."""
+    buffer = bytearray()
+    async for data in stream:
+        buffer += data
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def _write_chunk(f, hasher, chunk: bytes) -> None:
+    # hashlib releases the GIL on large buffers, so both run well off the event loop
+    f.write(chunk)
+    hasher.update(chunk)
+
+
+def _hash_file(path: Path, chunk_size: int) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class BlobStore:
+    """
+    Content-addressed file storage under upload_dir.
+
+    Blobs are stored once per sha256 at blobs/ab/abcd..., so uploading the
+    same bytes again only costs the hash. Bodies are streamed to a temp file
+    in fixed-size chunks and hashed as they are written, never held in memory
+    whole. Resumable uploads keep a .part file plus a small JSON descriptor
+    under tmp/; the part file's length is the upload offset, so an upload
+    survives dropped connections and restarts.
+
+    A stored blob is pinned until the caller has recorded the document that
+    references it (unpin), and garbage collection skips pinned blobs, so a
+    delete cannot remove a blob an upload has just deduplicated against.
+    """
+
+    def __init__(self, root: Path, chunk_size: int, max_size: int):
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self._hashers: Dict[str, Tuple[Any, int]] = {}  # session id -> (sha256 state, bytes hashed)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._pins: Dict[str, int] = {}
+        self._gc_lock = threading.Lock()  # Guards _pins and the check-then-unlink in collect()
+        self.dedup_hits = 0
+
+    @property
+    def tmp_dir(self) -> Path:
+        return self.root / "tmp"
+
+    def path(self, sha256: str) -> Path:
+        return self.root / "blobs" / sha256[:2] / sha256
+
+    def exists(self, sha256: str) -> bool:
+        return self.path(sha256).exists()
+
+    def pin(self, sha256: str) -> None:
+        """Protect a blob from garbage collection until unpin()."""
+        with self._gc_lock:
+            self._pins[sha256] = self._pins.get(sha256, 0) + 1
+
+    def unpin(self, sha256: str) -> None:
+        with self._gc_lock:
+            count = self._pins.get(sha256, 0) - 1
+            if count > 0:
+                self._pins[sha256] = count
+            else:
+                self._pins.pop(sha256, None)
+
+    def _commit(self, tmp: Path, sha256: str) -> None:
+        """Move a temp file into place (or drop it if the blob exists) and pin the blob."""
+        dest = self.path(sha256)
+        with self._gc_lock:
+            self._pins[sha256] = self._pins.get(sha256, 0) + 1
+            if dest.exists():
+                tmp.unlink()
+                self.dedup_hits += 1
+                return
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp, dest)
+
+    def collect(self, sha256s: Iterable[str]) -> None:
+        """
+        Delete blobs that are neither pinned nor referenced by any document.
+
+        Blocking: the reference check and unlink run under the GC lock, so call
+        it from a worker thread, after committing the delete.
+        """
+        with SessionLocal() as db:
+            for sha256 in set(sha256s):
+                with self._gc_lock:
+                    if self._pins.get(sha256):
+                        continue
+                    if not db.query(Document.id).filter(Document.sha256 == sha256).first():
+                        self.path(sha256).unlink(missing_ok=True)
+
+    async def write(self, stream: AsyncIterator[bytes]) -> Tuple[str, int]:
+        """Store a byte stream, returning its sha256 (pinned) and size."""
+        tmp = self.tmp_dir / f"{uuid.uuid4().hex}.upload"
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            f = await asyncio.to_thread(self._open, tmp, "wb")
+            try:
+                async for chunk in rechunk(stream, self.chunk_size):
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise UploadTooLarge(f"File exceeds {self.max_size} bytes")
+                    await asyncio.to_thread(_write_chunk, f, hasher, chunk)
+            finally:
+                await asyncio.to_thread(f.close)
+            sha256 = hasher.hexdigest()
+            await asyncio.to_thread(self._commit, tmp, sha256)
+        except BaseException:
+            await asyncio.to_thread(tmp.unlink, missing_ok=True)
+            raise
+        return sha256, size
+
+    def _open(self, path: Path, mode: str):
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        return open(path, mode)
+
+    # Resumable uploads
+
+    def _session_paths(self, session_id: str) -> Tuple[Path, Path]:
+        if not session_id.isalnum():
+            raise UploadError("Invalid upload id")
+        return self.tmp_dir / f"{session_id}.json", self.tmp_dir / f"{session_id}.part"
+
+    def create_session(self, project_id: int, filename: str, size: int,
+                       content_type: str | None = None, sha256: str | None = None) -> Dict[str, Any]:
+        if size > self.max_size:
+            raise UploadTooLarge(f"File exceeds {self.max_size} bytes")
+        self.cleanup_sessions()
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        session = {
+            "id": uuid.uuid4().hex,
+            "project_id": project_id,
+            "filename": filename,
+            "content_type": content_type,
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "created_at": time.time(),
+        }
+        meta, part = self._session_paths(session["id"])
+        part.touch()
+        meta.write_bytes(fastjson.dumps(session))
+        return session
+
+    def get_session(self, session_id: str) -> Dict[str, Any] | None:
+        meta, part = self._session_paths(session_id)
+        try:
+            session = fastjson.loads(meta.read_bytes())
+            session["offset"] = part.stat().st_size
+        except (OSError, fastjson.JSONDecodeError):
+            return None
+        return session
+
+    async def append(self, session: Dict[str, Any], offset: int, stream: AsyncIterator[bytes]) -> int:
+        """Append a chunk at `offset`; bytes received before a disconnect are kept."""
+        lock = self._locks.setdefault(session["id"], asyncio.Lock())
+        async with lock:
+            _, part = self._session_paths(session["id"])
+            current = (await asyncio.to_thread(part.stat)).st_size
+            if offset != current:
+                raise OffsetMismatch(current)
+
+            hasher, hashed = self._hashers.get(session["id"], (None, 0))
+            if current == 0:
+                hasher = hashlib.sha256()
+            elif hasher is not None and hashed != current:
+                hasher = None
+            # Without a live hash state (e.g. after a restart) the file is hashed from disk on finish
+            written = current
+            try:
+                f = await asyncio.to_thread(self._open, part, "ab")
+                try:
+                    async for chunk in rechunk(stream, self.chunk_size):
+                        if written + len(chunk) > session["size"]:
+                            raise UploadTooLarge("Chunk runs past the declared upload size")
+                        if hasher is None:
+                            await asyncio.to_thread(f.write, chunk)
+                        else:
+                            await asyncio.to_thread(_write_chunk, f, hasher, chunk)
+                        written += len(chunk)
+                finally:
+                    await asyncio.to_thread(f.close)
+            finally:
+                if hasher is not None:
+                    self._hashers[session["id"]] = (hasher, written)
+            return written
+
+    async def finish(self, session: Dict[str, Any]) -> str:
+        """Move a fully received upload into the blob store and return its sha256 (pinned)."""
+        meta, part = self._session_paths(session["id"])
+        size = (await asyncio.to_thread(part.stat)).st_size
+        if size != session["size"]:
+            raise OffsetMismatch(size)
+
+        hasher, hashed = self._hashers.pop(session["id"], (None, 0))
+        if hasher is not None and hashed == size:
+            sha256 = hasher.hexdigest()
+        else:
+            sha256 = await asyncio.to_thread(_hash_file, part, self.chunk_size)
+        if session["sha256"] and sha256 != session["sha256"]:
+            self.cancel_session(session["id"])
+            raise ChecksumMismatch("Uploaded bytes do not match the declared sha256")
+
+        await asyncio.to_thread(self._commit, part, sha256)
+        meta.unlink(missing_ok=True)
+        self._locks.pop(session["id"], None)
+        return sha256
+
+    def cancel_session(self, session_id: str) -> None:
+        for path in self._session_paths(session_id):
+            path.unlink(missing_ok=True)
+        self._hashers.pop(session_id, None)
+        self._locks.pop(session_id, None)
+
+    def cleanup_sessions(self) -> None:
+        """Drop resumable uploads untouched for longer than upload_session_ttl."""
+        if not self.tmp_dir.exists():
+            return
+        cutoff = time.time() - settings.upload_session_ttl
+        for path in self.tmp_dir.iterdir():
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                continue
+
+
+# Singleton instance
+blob_store = BlobStore(settings.upload_dir, settings.upload_chunk_size, settings.max_upload_size)
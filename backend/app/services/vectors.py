@@ -0,0 +1,324 @@
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from app.config import settings
+
+VECTORS_FILE = "vectors.f32"
+IDS_FILE = "ids.i64"
+ALIVE_FILE = "alive.u8"
+META_FILE = "meta.json"
+IVF_FILE = "ivf.npz"
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Unit-length rows, so inner product is cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on unit vectors; returns k unit centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        empty = ~sums.any(axis=1)
+        # Reseed empty lists from random points
+        sums[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def _top_k(scores: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        scores, rows = scores[part], rows[part]
+    order = np.argsort(-scores)
+    return scores[order], rows[order]
+
+
+class ProjectIndex:
+    """
+    Vector index for one project, stored in its own directory.
+
+    Rows are unit float32 vectors in an append-only file that is memory-mapped
+    on load, so opening an index costs nothing regardless of its size. Each
+    row has a chunk id and an alive flag; deletes clear the flag and the
+    files are compacted once enough rows are dead. meta.json records the row
+    count, so a torn append after a crash is ignored.
+
+    Up to vector_ivf_threshold live rows, search is an exact vectorized scan.
+    Above it an IVF index (k-means lists, stored sorted by list) is built and
+    only the vector_ivf_nprobe nearest lists are scanned, plus any rows added
+    since the last build.
+
+    meta.json also names the embedding model. Vectors from another model are
+    not comparable, so adding them resets the index (documents are
+    re-ingested when the model changes) and queries from another model
+    find nothing until then.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.lock = threading.RLock()
+        self.dim = 0
+        self.count = 0
+        self.model: str | None = None
+        self.vectors: np.ndarray | None = None
+        self.ids: np.ndarray | None = None
+        self.alive: np.ndarray | None = None
+        self.ivf: Dict[str, np.ndarray] | None = None
+        self._load()
+
+    # Storage
+
+    def _path(self, name: str) -> Path:
+        return self.directory / name
+
+    def _load(self) -> None:
+        meta_path = self._path(META_FILE)
+        if not meta_path.exists():
+            return
+        meta = json.loads(meta_path.read_text())
+        self.dim = meta["dim"]
+        self.count = meta["count"]
+        self.model = meta.get("model")
+        self._map()
+        if meta.get("ivf") and self._path(IVF_FILE).exists():
+            with np.load(self._path(IVF_FILE)) as data:
+                self.ivf = {name: data[name] for name in data.files}
+
+    def _map(self) -> None:
+        if self.count == 0:
+            self.vectors = np.empty((0, self.dim), dtype=np.float32)
+            self.ids = np.empty(0, dtype=np.int64)
+            self.alive = np.empty(0, dtype=np.uint8)
+            return
+        self.vectors = np.memmap(self._path(VECTORS_FILE), dtype=np.float32, mode="r",
+                                 shape=(self.count, self.dim))
+        self.ids = np.memmap(self._path(IDS_FILE), dtype=np.int64, mode="r", shape=(self.count,))
+        self.alive = np.memmap(self._path(ALIVE_FILE), dtype=np.uint8, mode="r+", shape=(self.count,))
+
+    def _save_meta(self) -> None:
+        meta = {"dim": self.dim, "count": self.count, "model": self.model, "ivf": self.ivf is not None}
+        tmp = self._path(META_FILE + ".tmp")
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, self._path(META_FILE))
+
+    def _truncate(self) -> None:
+        """Cut files back to the committed row count (drops a torn append)."""
+        for name, width in ((VECTORS_FILE, 4 * self.dim), (IDS_FILE, 8), (ALIVE_FILE, 1)):
+            path = self._path(name)
+            if path.exists() and path.stat().st_size != self.count * width:
+                with open(path, "r+b") as f:
+                    f.truncate(self.count * width)
+
+    @property
+    def live(self) -> int:
+        return 0 if self.alive is None else int(np.count_nonzero(self.alive))
+
+    # Updates
+
+    def add(self, ids: List[int], vectors: np.ndarray, model: str | None = None) -> None:
+        if not len(ids):
+            return
+        vectors = normalize(vectors)
+        if len(ids) != len(vectors):
+            raise ValueError(f"Got {len(ids)} ids for {len(vectors)} vectors")
+        with self.lock:
+            if self.dim and (self.live == 0 or model != self.model):
+                # Empty, or holding another model's vectors: start over
+                self.reset()
+            if self.dim == 0:
+                self.dim = vectors.shape[1]
+                self.model = model
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._truncate()
+            self._release()
+            with open(self._path(VECTORS_FILE), "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._path(IDS_FILE), "ab") as f:
+                f.write(np.asarray(ids, dtype=np.int64).tobytes())
+            with open(self._path(ALIVE_FILE), "ab") as f:
+                f.write(np.ones(len(ids), dtype=np.uint8).tobytes())
+            self.count += len(ids)
+            self._save_meta()
+            self._map()
+            self._maybe_build()
+
+    def delete(self, ids: List[int]) -> int:
+        """Tombstone rows by chunk id; returns how many were live."""
+        if self.count == 0 or not len(ids):
+            return 0
+        with self.lock:
+            rows = np.flatnonzero(np.isin(self.ids, np.asarray(ids, dtype=np.int64)) & (self.alive == 1))
+            if len(rows):
+                self.alive[rows] = 0
+                self.alive.flush()
+                if self.count - self.live > settings.vector_compact_ratio * self.count:
+                    self.compact()
+            return len(rows)
+
+    def _release(self) -> None:
+        if isinstance(self.alive, np.memmap):
+            self.alive.flush()
+        self.vectors = self.ids = self.alive = None
+
+    def compact(self) -> None:
+        """Rewrite the files without dead rows."""
+        with self.lock:
+            keep = np.flatnonzero(self.alive == 1)
+            vectors = np.array(self.vectors[keep])
+            ids = np.array(self.ids[keep])
+            self._release()
+            for name, data in ((VECTORS_FILE, vectors), (IDS_FILE, ids),
+                               (ALIVE_FILE, np.ones(len(keep), dtype=np.uint8))):
+                tmp = self._path(name + ".tmp")
+                tmp.write_bytes(data.tobytes())
+                os.replace(tmp, self._path(name))
+            self.count = len(keep)
+            self.ivf = None
+            self._path(IVF_FILE).unlink(missing_ok=True)
+            self._save_meta()
+            self._map()
+            self._maybe_build()
+
+    def reset(self) -> None:
+        """Remove every row, so the next add sets the dimension and model."""
+        with self.lock:
+            self._release()
+            for name in (VECTORS_FILE, IDS_FILE, ALIVE_FILE, IVF_FILE, META_FILE):
+                self._path(name).unlink(missing_ok=True)
+            self.dim = 0
+            self.count = 0
+            self.model = None
+            self.ivf = None
+            self._map()
+
+    def _maybe_build(self) -> None:
+        live = self.live
+        if live < settings.vector_ivf_threshold:
+            if self.ivf is not None:
+                self.ivf = None
+                self._path(IVF_FILE).unlink(missing_ok=True)
+                self._save_meta()
+            return
+        # Rebuild once the unindexed tail is a sizeable share of the rows
+        if self.ivf is None or self.count - int(self.ivf["built"]) > 0.2 * int(self.ivf["built"]):
+            self.build_ivf()
+
+    def build_ivf(self) -> None:
+        with self.lock:
+            n = self.count
+            lists = settings.vector_ivf_lists or max(1, int(np.sqrt(n)))
+            rng = np.random.default_rng(0)
+            sample = self.vectors[np.sort(rng.choice(n, size=min(n, lists * 64), replace=False))]
+            centroids = kmeans(np.asarray(sample), lists)
+            assign = np.empty(n, dtype=np.int32)
+            for start in range(0, n, 65536):
+                block = self.vectors[start:start + 65536]
+                assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            order = np.argsort(assign, kind="stable").astype(np.int64)
+            bounds = np.searchsorted(assign[order], np.arange(lists + 1)).astype(np.int64)
+            self.ivf = {"centroids": centroids, "order": order, "bounds": bounds, "built": np.int64(n)}
+            tmp = self._path("ivf.tmp.npz")
+            np.savez(tmp, **self.ivf)
+            os.replace(tmp, self._path(IVF_FILE))
+            self._save_meta()
+
+    # Search
+
+    def search(self, query: np.ndarray, k: int, model: str | None = None) -> List[Tuple[int, float]]:
+        """Top-k (chunk id, cosine similarity) pairs."""
+        with self.lock:
+            if self.count == 0 or self.live == 0 or model != self.model:
+                return []
+            query = normalize(query).reshape(-1)
+            if query.shape[0] != self.dim:
+                raise ValueError(f"Expected a {self.dim}-dimensional query")
+
+            if self.ivf is None:
+                rows = np.flatnonzero(self.alive)
+                scores = self.vectors @ query
+                scores = scores[rows]
+            else:
+                ivf = self.ivf
+                nprobe = min(settings.vector_ivf_nprobe, len(ivf["centroids"]))
+                probes = np.argpartition(-(ivf["centroids"] @ query), nprobe - 1)[:nprobe]
+                bounds = ivf["bounds"]
+                parts = [ivf["order"][bounds[p]:bounds[p + 1]] for p in probes]
+                parts.append(np.arange(int(ivf["built"]), self.count))  # Not indexed yet
+                rows = np.sort(np.concatenate(parts))  # Sorted rows read the memmap sequentially
+                rows = rows[self.alive[rows] == 1]
+                scores = self.vectors[rows] @ query
+
+            if not len(rows):
+                return []
+            scores, rows = _top_k(scores, rows, k)
+            return [(int(self.ids[row]), float(score)) for row, score in zip(rows, scores)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "dim": self.dim,
+            "rows": self.count,
+            "live": self.live,
+            "ivf_lists": 0 if self.ivf is None else len(self.ivf["centroids"]),
+        }
+
+
+class VectorStore:
+    """Per-project vector indexes under vector_dir, opened lazily and kept open."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._indexes: Dict[int, ProjectIndex] = {}
+        self._lock = threading.Lock()
+
+    def index(self, project_id: int) -> ProjectIndex:
+        with self._lock:
+            index = self._indexes.get(project_id)
+            if index is None:
+                index = ProjectIndex(self.root / str(project_id))
+                self._indexes[project_id] = index
+            return index
+
+    def has_vectors(self, project_id: int) -> bool:
+        if project_id in self._indexes:
+            return self._indexes[project_id].live > 0
+        return (self.root / str(project_id) / META_FILE).exists()
+
+    def add(self, project_id: int, ids: List[int], vectors: np.ndarray, model: str | None = None) -> None:
+        self.index(project_id).add(ids, vectors, model)
+
+    def delete(self, project_id: int, ids: List[int]) -> int:
+        return self.index(project_id).delete(ids)
+
+    def search(self, project_id: int, query: np.ndarray, k: int, model: str | None = None) -> List[Tuple[int, float]]:
+        return self.index(project_id).search(query, k, model)
+
+    def drop(self, project_id: int) -> None:
+        """Delete a project's index entirely."""
+        with self._lock:
+            index = self._indexes.pop(project_id, None)
+            if index is not None:
+                with index.lock:
+                    index._release()
+            shutil.rmtree(self.root / str(project_id), ignore_errors=True)
+
+    def stats(self) -> Dict[int, Dict[str, Any]]:
+        with self._lock:
+            return {project_id: index.stats() for project_id, index in self._indexes.items()}
+
+
+# Singleton instance
+vector_store = VectorStore(settings.vector_dir)
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Tuple
+from sqlalchemy import update
+from app.config import settings
+from app.database import AsyncSessionLocal, Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriter:
+    """
+    Write-behind batching for chat messages.
+
+    Concurrent turns hand their messages to one background writer, which
+    commits everything that arrived within a short flush window in a single
+    transaction (group commit) and touches each conversation's updated_at
+    once. Callers await their message, so ids are known and the row is
+    durable before the caller reports it to a client.
+    """
+
+    def __init__(self):
+        self._pending: List[Tuple[Message, asyncio.Future]] = []
+        self._wakeup: asyncio.Event | None = None
+        self._lock: asyncio.Lock | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        self.batches = 0
+        self.messages_written = 0
+
+    def _ensure_primitives(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+
+    def submit(self, conversation_id: int, role: str, content: str, truncated: bool = False) -> asyncio.Future:
+        """Queue a message without waiting; the future resolves once it is committed."""
+        self._ensure_primitives()
+        message = Message(
+            conversation_id=conversation_id,
+            role=role,
+            content=content,
+            truncated=truncated,
+            created_at=datetime.utcnow(),
+        )
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((message, future))
+
+        if self._task is None:
+            # Not started (scripts, tests): write through
+            asyncio.ensure_future(self.flush())
+        else:
+            self._wakeup.set()
+        return future
+
+    async def add_message(self, conversation_id: int, role: str, content: str) -> Message:
+        """Queue a message and wait until its batch is committed."""
+        return await self.submit(conversation_id, role, content)
+
+    def has_pending(self, conversation_id: int) -> bool:
+        return any(msg.conversation_id == conversation_id for msg, _ in self._pending)
+
+    async def flush(self) -> None:
+        """Commit everything queued so far in one transaction."""
+        self._ensure_primitives()
+        async with self._lock:
+            while self._pending:
+                # Entries stay visible to has_pending() until committed
+                batch = self._pending[:settings.write_behind_max_batch]
+                await self._write(batch)
+                del self._pending[:len(batch)]
+
+    async def _write(self, batch: List[Tuple[Message, asyncio.Future]]) -> None:
+        touched: Dict[int, datetime] = {}
+        for message, _ in batch:
+            touched[message.conversation_id] = max(
+                message.created_at, touched.get(message.conversation_id, message.created_at)
+            )
+
+        try:
+            async with AsyncSessionLocal() as db:
+                db.add_all([message for message, _ in batch])
+                for conversation_id, updated_at in touched.items():
+                    await db.execute(
+                        update(Conversation)
+                        .where(Conversation.id == conversation_id)
+                        .values(updated_at=updated_at)
+                    )
+                await db.commit()
+        except Exception as e:
+            logger.exception("Failed to write batch of %d messages", len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.messages_written += len(batch)
+        for message, future in batch:
+            if not future.done():
+                future.set_result(message)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # Let concurrent turns join the batch unless it is already full
+            if len(self._pending) < settings.write_behind_max_batch:
+                await asyncio.sleep(settings.write_behind_flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Message writer flush failed")
+
+    async def start(self) -> None:
+        self._ensure_primitives()
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the writer, committing anything still queued."""
+        if self._task is not None:
+            # Let the loop finish its current batch rather than cancelling mid-commit
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "messages_written": self.messages_written,
+        }
+
+
+# Singleton instance
+message_writer = MessageWriter()
@@ -0,0 +1,66 @@
+"""JSON helpers that use orjson when installed and fall back to the stdlib."""
+import json
+from typing import Any, Callable, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+Loads = Callable[[bytes], Any]
+
+
+if orjson is not None:
+    JSONDecodeError = orjson.JSONDecodeError
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(data: bytes | str):
+        return orjson.loads(data)
+else:
+    JSONDecodeError = json.JSONDecodeError
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def loads(data: bytes | str):
+        return json.loads(data)
+
+
+def _stdlib() -> Tuple[Loads, Tuple[type, ...]]:
+    # json.loads on bytes sniffs the encoding first; callers here always have UTF-8
+    decode = json.JSONDecoder().decode
+    return (lambda data: decode(data.decode())), (ValueError,)
+
+
+def _orjson() -> Tuple[Loads, Tuple[type, ...]]:
+    if orjson is None:
+        raise ImportError("orjson is not installed")
+    return orjson.loads, (orjson.JSONDecodeError,)
+
+
+def _msgspec() -> Tuple[Loads, Tuple[type, ...]]:
+    import msgspec
+    return msgspec.json.Decoder().decode, (msgspec.DecodeError,)
+
+
+BACKENDS = {"orjson": _orjson, "msgspec": _msgspec, "json": _stdlib}
+
+
+def get_loads(name: str = "auto") -> Tuple[Loads, Tuple[type, ...]]:
+    """
+    Resolve a bytes decode function by backend name, and the errors it raises.
+
+    'auto' prefers orjson, then msgspec, then the stdlib.
+    """
+    if name == "auto":
+        for candidate in ("orjson", "msgspec"):
+            try:
+                return BACKENDS[candidate]()
+            except ImportError:
+                continue
+        return _stdlib()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown JSON decoder: {name}")
+    return BACKENDS[name]()
@@ -0,0 +1,46 @@
+"""Newline-delimited JSON decoding on raw byte chunks."""
+from typing import Any, List
+from app.config import settings
+from app.utils.fastjson import get_loads
+
+
+class NDJSONDecoder:
+    """
+    Incremental NDJSON decoder.
+
+    Splits byte chunks on newlines and decodes each complete line straight
+    from bytes, carrying any partial line over to the next chunk. Malformed
+    lines are skipped, as Ollama streams are parsed leniently.
+    """
+
+    def __init__(self, decoder: str | None = None):
+        self._loads, self._errors = get_loads(decoder or settings.ollama_json_decoder)
+        self._buffer = b""
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        data = self._buffer + chunk if self._buffer else chunk
+        loads = self._loads
+        results = []
+        start = 0
+        while True:
+            end = data.find(b"\n", start)
+            if end == -1:
+                break
+            if end > start:
+                try:
+                    results.append(loads(data[start:end]))
+                except self._errors:
+                    pass
+            start = end + 1
+        self._buffer = data[start:]
+        return results
+
+    def close(self) -> List[Any]:
+        """Decode a trailing line that had no newline."""
+        data, self._buffer = self._buffer, b""
+        if not data.strip():
+            return []
+        try:
+            return [self._loads(data)]
+        except self._errors:
+            return []
@@ -0,0 +1,130 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List
+from app import metrics
+from app.config import settings
+from app.utils import fastjson
+
+HEARTBEAT = b": keep-alive\n\n"
+
+# Headers that stop proxies from buffering or caching the stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def encode_event(data: Dict[str, Any]) -> bytes:
+    """Encode one SSE frame with a JSON payload."""
+    return b"data: " + fastjson.dumps(data) + b"\n\n"
+
+
+class SSEStream:
+    """
+    Turns an async iterator of events into SSE frames.
+
+    Dict events are sent as one JSON frame each. String events are content
+    tokens: they are buffered and sent as {"content": ...} frames, flushed
+    when nothing else is immediately available and the coalesce window has
+    passed, or when the buffer reaches coalesce_bytes. A producer running
+    ahead of a slow client therefore gets fewer, larger frames. Heartbeat
+    comments keep idle proxies from dropping long generations.
+    """
+
+    def __init__(
+        self,
+        coalesce_interval: float | None = None,
+        coalesce_bytes: int | None = None,
+        heartbeat_interval: float | None = None,
+    ):
+        self.coalesce_interval = (
+            settings.sse_coalesce_interval if coalesce_interval is None else coalesce_interval
+        )
+        self.coalesce_bytes = settings.sse_coalesce_bytes if coalesce_bytes is None else coalesce_bytes
+        self.heartbeat_interval = (
+            settings.sse_heartbeat_interval if heartbeat_interval is None else heartbeat_interval
+        )
+        self.frames_sent = 0
+
+    async def encode(self, events: AsyncIterator[str | Dict[str, Any]]) -> AsyncIterator[bytes]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.sse_queue_size)
+
+        async def produce():
+            try:
+                async for item in events:
+                    await queue.put(item)
+            except Exception as e:
+                await queue.put(_Failure(e))
+                return
+            finally:
+                # Run the event source's cleanup now rather than at garbage collection
+                aclose = getattr(events, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            await queue.put(_DONE)
+
+        producer = asyncio.create_task(produce())
+        buffer: List[str] = []
+        buffered_bytes = 0
+        buffered_at = 0.0
+        last_sent = time.monotonic()
+
+        def flush_tokens() -> bytes:
+            nonlocal buffer, buffered_bytes
+            frame = encode_event({"content": "".join(buffer)})
+            buffer = []
+            buffered_bytes = 0
+            return frame
+
+        try:
+            while True:
+                now = time.monotonic()
+                deadline = last_sent + self.heartbeat_interval
+                if buffer:
+                    deadline = min(deadline, buffered_at + self.coalesce_interval)
+                try:
+                    item = await asyncio.wait_for(queue.get(), max(0.0, deadline - now))
+                except asyncio.TimeoutError:
+                    self.frames_sent += 1
+                    last_sent = time.monotonic()
+                    yield flush_tokens() if buffer else HEARTBEAT
+                    continue
+
+                if isinstance(item, str):
+                    if not buffer:
+                        buffered_at = time.monotonic()
+                    buffer.append(item)
+                    buffered_bytes += len(item)
+                    window_passed = time.monotonic() - buffered_at >= self.coalesce_interval
+                    if buffered_bytes >= self.coalesce_bytes or (queue.empty() and window_passed):
+                        self.frames_sent += 1
+                        last_sent = time.monotonic()
+                        yield flush_tokens()
+                    continue
+
+                if buffer:
+                    self.frames_sent += 1
+                    last_sent = time.monotonic()
+                    yield flush_tokens()
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.error
+                self.frames_sent += 1
+                last_sent = time.monotonic()
+                yield encode_event(item)
+        finally:
+            metrics.sse_frames_sent.observe(self.frames_sent)
+            # Client went away or stream ended: stop the producer and its upstream
+            producer.cancel()
+            try:
+                await producer
+            except (asyncio.CancelledError, Exception):
+                pass
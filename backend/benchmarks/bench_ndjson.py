@@ -0,0 +1,86 @@
+"""
+Micro-benchmark for Ollama stream parsing.
+
+Compares the old per-line str + json.loads path with NDJSONDecoder on
+each available JSON backend, reporting tokens/sec of parsing overhead.
+Run from the backend directory:
+
+    python -m benchmarks.bench_ndjson
+"""
+import json
+import time
+from app.utils.fastjson import BACKENDS
+from app.utils.ndjson import NDJSONDecoder
+
+TOKENS = 200_000
+CHUNK_SIZE = 4096  # Roughly what a socket read hands back
+
+
+def make_stream(tokens: int) -> bytes:
+    lines = [
+        json.dumps({
+            "model": "llama3.2",
+            "created_at": "2024-12-26T12:00:00.000000Z",
+            "message": {"role": "assistant", "content": f" tok{i}"},
+            "done": False,
+        })
+        for i in range(tokens)
+    ]
+    lines.append(json.dumps({
+        "model": "llama3.2",
+        "done": True,
+        "eval_count": tokens,
+        "eval_duration": 1,
+        "prompt_eval_duration": 1,
+    }))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def chunks(body: bytes):
+    for i in range(0, len(body), CHUNK_SIZE):
+        yield body[i:i + CHUNK_SIZE]
+
+
+def baseline(body: bytes) -> int:
+    """The previous path: decode to str, split lines, json.loads, nested key checks."""
+    count = 0
+    pending = ""
+    for chunk in chunks(body):
+        pending += chunk.decode()
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            if line:
+                data = json.loads(line)
+                if "message" in data and "content" in data["message"]:
+                    if data["message"]["content"]:
+                        count += 1
+    return count
+
+
+def decoder(body: bytes, name: str) -> int:
+    count = 0
+    ndjson = NDJSONDecoder(name)
+    for chunk in chunks(body):
+        for data in ndjson.feed(chunk):
+            message = data.get("message")
+            if message and message.get("content"):
+                count += 1
+    return count
+
+
+def report(label: str, fn, *args) -> None:
+    start = time.perf_counter()
+    count = fn(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<20} {count / elapsed:>14,.0f} tokens/sec  ({elapsed * 1e6 / count:.2f} µs/token)")
+
+
+if __name__ == "__main__":
+    body = make_stream(TOKENS)
+    print(f"{TOKENS:,} tokens, {len(body) / 1e6:.1f} MB\n")
+    report("str lines + json", baseline, body)
+    for name in BACKENDS:
+        try:
+            report(f"NDJSONDecoder[{name}]", decoder, body, name)
+        except ImportError:
+            print(f"NDJSONDecoder[{name}]  not installed")
@@ -0,0 +1,72 @@
+"""
+Micro-benchmark for the project vector index.
+
+Builds an index of clustered random vectors (embeddings cluster by topic,
+uniform noise would make IVF look worse than it is), then compares the
+exact scan with the IVF index: recall@k against the exact results and
+p50/p95 query latency. Run from the backend directory:
+
+    python -m benchmarks.bench_vectors
+"""
+import tempfile
+import time
+import numpy as np
+from app.config import settings
+from app.services.vectors import ProjectIndex
+
+ROWS = 100_000
+DIM = 768  # nomic-embed-text
+CLUSTERS = 256
+QUERIES = 200
+K = 10
+
+
+def make_vectors(rows: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((CLUSTERS, DIM)).astype(np.float32)
+    assign = rng.integers(0, CLUSTERS, size=rows)
+    return centers[assign] + 0.6 * rng.standard_normal((rows, DIM)).astype(np.float32)
+
+
+def run(index: ProjectIndex, queries: np.ndarray):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append({chunk_id for chunk_id, _ in index.search(query, K)})
+        latencies.append(time.perf_counter() - start)
+    return results, np.array(latencies) * 1e3
+
+
+def report(label: str, latencies: np.ndarray, recall: float) -> None:
+    p50, p95 = np.percentile(latencies, [50, 95])
+    print(f"{label:<22} recall@{K} {recall:6.3f}   p50 {p50:7.2f} ms   p95 {p95:7.2f} ms")
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(ROWS, rng)
+    queries = make_vectors(QUERIES, rng)
+    print(f"{ROWS:,} vectors x {DIM} dims, {QUERIES} queries\n")
+
+    with tempfile.TemporaryDirectory() as root:
+        settings.vector_ivf_threshold = ROWS + 1  # Exact scan only
+        index = ProjectIndex(root)
+        start = time.perf_counter()
+        index.add(list(range(ROWS)), vectors)
+        print(f"{'add':<22} {time.perf_counter() - start:.2f} s")
+
+        start = time.perf_counter()
+        ProjectIndex(root)
+        print(f"{'open':<22} {(time.perf_counter() - start) * 1e3:.2f} ms\n")
+
+        exact, latencies = run(index, queries)
+        report("exact", latencies, 1.0)
+
+        start = time.perf_counter()
+        index.build_ivf()
+        print(f"{'build ivf':<22} {time.perf_counter() - start:.2f} s "
+              f"({len(index.ivf['centroids'])} lists)")
+        for nprobe in (1, 4, 8, 16, 32):
+            settings.vector_ivf_nprobe = nprobe
+            found, latencies = run(index, queries)
+            recall = np.mean([len(a & b) / K for a, b in zip(found, exact)])
+            report(f"ivf nprobe={nprobe}", latencies, recall)
@@ -1,12 +1,13 @@
 """
-Database migration script to add new columns to projects table.
+Database migration script to add new columns and indexes to existing tables.
 Run this once to upgrade existing database.
 """
 import sqlite3
 from pathlib import Path
+from app.database import MESSAGE_SEARCH_DDL, MESSAGE_SEARCH_REBUILD
 
 def migrate_database():
-    """Add new columns to projects table."""
+    """Add new columns to the projects and conversations tables."""
     db_path = Path("../data/ai_platform.db")
     
     if not db_path.exists():
@@ -51,6 +52,85 @@ def migrate_database():
         else:
             print("✓ last_accessed column already exists")
         
+        # Rolling conversation summaries
+        cursor.execute("PRAGMA table_info(conversations)")
+        columns = [col[1] for col in cursor.fetchall()]
+        
+        if 'summary' not in columns:
+            print("Adding conversations.summary column...")
+            cursor.execute("ALTER TABLE conversations ADD COLUMN summary TEXT")
+            conn.commit()
+            print("✓ Added conversations.summary column")
+        else:
+            print("✓ conversations.summary column already exists")
+        
+        if 'summary_message_id' not in columns:
+            print("Adding conversations.summary_message_id column...")
+            cursor.execute("ALTER TABLE conversations ADD COLUMN summary_message_id INTEGER")
+            conn.commit()
+            print("✓ Added conversations.summary_message_id column")
+        else:
+            print("✓ conversations.summary_message_id column already exists")
+        
+        # Truncation marker for answers cut short by a client disconnect
+        cursor.execute("PRAGMA table_info(messages)")
+        columns = [col[1] for col in cursor.fetchall()]
+        
+        if 'truncated' not in columns:
+            print("Adding messages.truncated column...")
+            cursor.execute("ALTER TABLE messages ADD COLUMN truncated BOOLEAN DEFAULT 0")
+            conn.commit()
+            print("✓ Added messages.truncated column")
+        else:
+            print("✓ messages.truncated column already exists")
+        
+        # Ingestion state on uploaded documents (table is created by the app if missing)
+        cursor.execute("PRAGMA table_info(documents)")
+        columns = [col[1] for col in cursor.fetchall()]
+        
+        if columns:
+            document_columns = {
+                "ingest_status": "TEXT DEFAULT 'pending'",
+                "ingest_key": "VARCHAR(64)",
+                "ingest_error": "TEXT",
+                "chunk_count": "INTEGER DEFAULT 0",
+            }
+            for name, definition in document_columns.items():
+                if name not in columns:
+                    cursor.execute(f"ALTER TABLE documents ADD COLUMN {name} {definition}")
+                    conn.commit()
+                    print(f"✓ Added documents.{name} column")
+                else:
+                    print(f"✓ documents.{name} column already exists")
+        
+        # Indexes for the chat queries (same names as app.database models)
+        indexes = {
+            "ix_messages_conversation_created": "messages (conversation_id, created_at)",
+            "ix_conversations_project_updated": "conversations (project_id, updated_at)",
+        }
+        for name, target in indexes.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+            print(f"✓ Index {name} present")
+        conn.commit()
+        
+        # Full-text message search: create the index and triggers, backfilling existing messages
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'")
+        search_exists = cursor.fetchone() is not None
+        for statement in MESSAGE_SEARCH_DDL:
+            cursor.execute(statement)
+        if not search_exists:
+            print("Indexing messages for search...")
+            cursor.execute(MESSAGE_SEARCH_REBUILD)
+            conn.commit()
+            print("✓ Indexed messages for search")
+        else:
+            print("✓ Message search index already exists")
+        
+        # WAL is persistent in the database file; the other pragmas are set per connection
+        journal_mode = cursor.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        print(f"✓ Journal mode is {journal_mode}")
+        cursor.execute("PRAGMA optimize")
+        
         print("\n✅ Database migration completed successfully!")
         
     except Exception as e:
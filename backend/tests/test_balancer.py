@@ -0,0 +1,144 @@
+"""BackendPool routing and health, against fake Ollama nodes (httpx.MockTransport)."""
+import httpx
+import pytest
+from app.config import settings
+from app.services.balancer import BackendPool, NoBackendAvailable, OllamaBackend
+
+
+class FakeOllama:
+    """Answers /api/tags and /api/ps like an Ollama node, or fails while `down`."""
+
+    def __init__(self, models=("llama3.2:latest",), loaded=()):
+        self.models = list(models)
+        self.loaded = list(loaded)
+        self.down = False
+        self.requests = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.down:
+            raise httpx.ConnectError("connection refused", request=request)
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": [{"name": m} for m in self.models]})
+        if request.url.path == "/api/ps":
+            return httpx.Response(200, json={"models": [{"name": m} for m in self.loaded]})
+        return httpx.Response(404)
+
+
+def make_backend(url: str, fake: FakeOllama | None = None) -> OllamaBackend:
+    return OllamaBackend(url, transport=httpx.MockTransport(fake or FakeOllama()))
+
+
+def make_pool(n: int, models=("llama3.2:latest",)) -> BackendPool:
+    pool = BackendPool([make_backend(f"http://node{i}:11434") for i in range(n)])
+    for backend in pool.backends:
+        backend.available_models = set(models)
+        backend.loaded_models = set(models)
+    return pool
+
+
+@pytest.fixture(autouse=True)
+def balancer_settings(monkeypatch):
+    monkeypatch.setattr(settings, "ollama_cold_model_penalty", 2)
+    monkeypatch.setattr(settings, "ollama_unhealthy_threshold", 2)
+    monkeypatch.setattr(settings, "scheduler_max_concurrent_per_backend", 2)
+
+
+def test_picks_least_loaded():
+    pool = make_pool(3)
+    pool.backends[0].in_flight = 3
+    pool.backends[1].in_flight = 1
+    pool.backends[2].in_flight = 2
+    for _ in range(5):
+        assert pool.pick("llama3.2") is pool.backends[1]
+
+
+def test_ties_rotate_round_robin():
+    pool = make_pool(3)
+    picked = [pool.pick("llama3.2").base_url for _ in range(6)]
+    assert picked[:3] == picked[3:]
+    assert set(picked) == {b.base_url for b in pool.backends}
+
+
+def test_skips_nodes_without_the_model_unless_none_have_it():
+    pool = make_pool(2)
+    pool.backends[0].available_models = {"mistral:latest"}
+    pool.backends[1].in_flight = 5
+    assert pool.pick("llama3.2") is pool.backends[1]
+    # Nobody lists it: tags may be stale, so fall back to every healthy node
+    assert pool.pick("qwen2.5") in pool.backends
+
+
+def test_cold_model_penalty_prefers_warm_nodes_until_busy():
+    pool = make_pool(2)
+    warm, cold = pool.backends
+    cold.loaded_models = set()
+    warm.in_flight = 1
+    assert pool.pick("llama3.2") is warm
+    # Past the penalty the cold node is less loaded
+    warm.in_flight = 3
+    assert pool.pick("llama3.2") is cold
+
+
+def test_prefer_wins_up_to_the_per_backend_cap():
+    pool = make_pool(2)
+    preferred, other = pool.backends
+    preferred.in_flight = 1
+    assert pool.pick("llama3.2", prefer=preferred.base_url) is preferred
+    preferred.in_flight = settings.scheduler_max_concurrent_per_backend
+    assert pool.pick("llama3.2", prefer=preferred.base_url) is other
+
+
+def test_prefer_ignored_when_ejected():
+    pool = make_pool(2)
+    preferred, other = pool.backends
+    preferred.healthy = False
+    assert pool.pick("llama3.2", prefer=preferred.base_url) is other
+
+
+@pytest.mark.asyncio
+async def test_ejected_after_threshold_failures_and_readmitted_on_probe():
+    fakes = [FakeOllama(), FakeOllama()]
+    pool = BackendPool([make_backend(f"http://node{i}:11434", f) for i, f in enumerate(fakes)])
+    await pool.probe_all()
+    assert all(b.healthy for b in pool.backends)
+    flaky, steady = pool.backends
+
+    fakes[0].down = True
+    assert await flaky.probe() is False
+    assert flaky.healthy  # One failure is below the threshold
+    assert await flaky.probe() is False
+    assert not flaky.healthy
+    assert pool.healthy_backends() == [steady]
+    for _ in range(4):
+        assert pool.pick("llama3.2") is steady
+
+    fakes[0].down = False
+    assert await flaky.probe() is True
+    assert flaky.healthy
+    assert flaky.consecutive_failures == 0
+    assert flaky.available_models == {"llama3.2:latest"}
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_no_backend_available_when_all_ejected():
+    fake = FakeOllama()
+    fake.down = True
+    pool = BackendPool([make_backend("http://node0:11434", fake)])
+    for _ in range(settings.ollama_unhealthy_threshold):
+        await pool.probe_all()
+    with pytest.raises(NoBackendAvailable):
+        pool.pick("llama3.2")
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_probe_records_resident_models():
+    fake = FakeOllama(models=("llama3.2:latest", "mistral:latest"), loaded=("mistral:latest",))
+    backend = make_backend("http://node0:11434", fake)
+    await backend.probe()
+    assert backend.has_model("llama3.2")
+    assert backend.has_loaded("mistral")
+    assert not backend.has_loaded("llama3.2")
+    await backend.close()
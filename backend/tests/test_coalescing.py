@@ -0,0 +1,129 @@
+"""Sharing identical deterministic generations (OllamaService.join/lead), against a fake Ollama node."""
+import asyncio
+import json
+import httpx
+import pytest
+from app.config import settings
+from app.services.balancer import BackendPool, OllamaBackend
+from app.services.ollama import LeaderAbandoned, OllamaService
+
+
+class FakeChat:
+    """Streams `tokens` chat chunks per /api/chat call, each after `delay` seconds."""
+
+    def __init__(self, tokens=5, delay=0.01):
+        self.tokens = tokens
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path != "/api/chat":
+            return httpx.Response(404)
+        self.calls += 1
+
+        async def body():
+            for i in range(self.tokens):
+                await asyncio.sleep(self.delay)
+                yield (json.dumps({"message": {"content": f"t{i} "}, "done": False}) + "\n").encode()
+            yield (json.dumps({"done": True, "eval_count": self.tokens}) + "\n").encode()
+
+        return httpx.Response(200, content=body())
+
+
+def make_service(fake: FakeChat) -> OllamaService:
+    backend = OllamaBackend("http://node0:11434", transport=httpx.MockTransport(fake))
+    backend.available_models = {"llama3.2:latest"}
+    return OllamaService(BackendPool([backend]))
+
+
+@pytest.fixture(autouse=True)
+def coalesce_settings(monkeypatch):
+    monkeypatch.setattr(settings, "ollama_coalesce_requests", True)
+
+
+def payload(service: OllamaService, temperature=0):
+    return service.chat_payload("llama3.2", [{"role": "user", "content": "hi"}], temperature=temperature)
+
+
+async def collect(stream):
+    return "".join([chunk async for chunk in stream if isinstance(chunk, str)])
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_share_one_generation():
+    fake = FakeChat()
+    service = make_service(fake)
+    body = payload(service)
+    assert service.coalescible(body)
+    assert not service.coalescible(payload(service, temperature=0.7))
+
+    leader = service.lead(body)
+    first = asyncio.create_task(collect(leader))
+    await asyncio.sleep(0.025)  # Follower joins mid-stream and gets the replay
+    follower = service.join(body)
+    assert follower is not None
+
+    results = await asyncio.gather(first, collect(follower))
+    assert results[0] == results[1] == "t0 t1 t2 t3 t4 "
+    assert fake.calls == 1
+    assert service.coalesced_requests == 1
+    # Finished generations are not joined again
+    assert service.join(body) is None
+
+
+@pytest.mark.asyncio
+async def test_follower_can_lead_again_when_queued_leader_abandons():
+    fake = FakeChat()
+    service = make_service(fake)
+    body = payload(service)
+
+    ready = asyncio.get_running_loop().create_future()
+    service.lead(body, ready)  # Leader waits for its slot and never starts listening
+    follower = asyncio.create_task(collect(service.join(body)))
+    await asyncio.sleep(0.01)
+    assert not follower.done()
+
+    ready.set_exception(LeaderAbandoned("left the queue"))
+    with pytest.raises(LeaderAbandoned):
+        await follower
+    assert fake.calls == 0
+
+    # The abandoned flight is gone, so the follower starts its own generation
+    assert service.join(body) is None
+    assert await collect(service.lead(body)) == "t0 t1 t2 t3 t4 "
+    assert fake.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_queued_leader_keeps_generation_for_followers():
+    fake = FakeChat()
+    service = make_service(fake)
+    body = payload(service)
+
+    released = []
+    ready = asyncio.get_running_loop().create_future()
+    service.lead(body, ready, on_done=lambda: released.append(True))
+    follower = asyncio.create_task(collect(service.join(body)))
+    await asyncio.sleep(0.01)
+
+    ready.set_result(None)  # Slot granted: the shared generation runs for the follower
+    assert await follower == "t0 t1 t2 t3 t4 "
+    await asyncio.sleep(0)
+    assert released == [True]
+
+
+@pytest.mark.asyncio
+async def test_generation_cancelled_when_last_listener_leaves():
+    fake = FakeChat(tokens=50)
+    service = make_service(fake)
+    body = payload(service)
+
+    leader = service.lead(body)
+    follower = service.join(body)
+    for stream in (leader, follower):
+        assert isinstance(await stream.__anext__(), str)
+    await leader.aclose()
+    assert service.cancelled_generations == 0
+    await follower.aclose()
+    await asyncio.sleep(0.01)
+    assert service.cancelled_generations == 1
@@ -0,0 +1,122 @@
+"""GenerationScheduler admission: per-model caps, project round-robin and the background class."""
+import pytest
+from app.config import settings
+from app.services.scheduler import GenerationScheduler, QueueFull
+
+
+@pytest.fixture(autouse=True)
+def scheduler_settings(monkeypatch):
+    monkeypatch.setattr(settings, "scheduler_max_concurrent_per_model", 2)
+    monkeypatch.setattr(settings, "scheduler_max_queue_per_project", 10)
+    monkeypatch.setattr(settings, "scheduler_max_queue_total", 100)
+    monkeypatch.setattr(settings, "scheduler_max_background_per_model", 1)
+
+
+def make_scheduler(capacity=100, backends=1) -> GenerationScheduler:
+    return GenerationScheduler(lambda: capacity, lambda model: backends)
+
+
+def granted(tickets):
+    return [t.granted for t in tickets]
+
+
+@pytest.mark.asyncio
+async def test_per_model_cap():
+    scheduler = make_scheduler()
+    tickets = [scheduler.submit("llama3.2", 1) for _ in range(3)]
+    assert granted(tickets) == [True, True, False]
+    # Other models have their own cap
+    assert scheduler.submit("mistral", 1).granted
+
+    tickets[0].release()
+    assert tickets[2].granted
+
+
+@pytest.mark.asyncio
+async def test_per_model_cap_scales_with_backends_serving_the_model():
+    scheduler = make_scheduler(backends=3)
+    tickets = [scheduler.submit("llama3.2", 1) for _ in range(7)]
+    assert sum(granted(tickets)) == 6
+
+
+@pytest.mark.asyncio
+async def test_global_capacity_caps_all_models():
+    scheduler = make_scheduler(capacity=3)
+    tickets = [scheduler.submit(model, 1) for model in ("a", "a", "b", "b")]
+    assert granted(tickets) == [True, True, True, False]
+
+
+@pytest.mark.asyncio
+async def test_round_robin_across_projects_fifo_within_a_project():
+    scheduler = make_scheduler()
+    running = [scheduler.submit("llama3.2", 0) for _ in range(2)]
+    busy = [scheduler.submit("llama3.2", 1) for _ in range(3)]
+    other = [scheduler.submit("llama3.2", 2) for _ in range(2)]
+
+    assert [scheduler.position(t) for t in busy] == [1, 3, 5]
+    assert [scheduler.position(t) for t in other] == [2, 4]
+
+    order = []
+    waiting = busy + other
+    for _ in range(len(waiting)):
+        running.pop(0).release()
+        newly = [t for t in waiting if t.granted and t not in order]
+        assert len(newly) == 1
+        order.extend(newly)
+        running.extend(newly)
+    assert order == [busy[0], other[0], busy[1], other[1], busy[2]]
+
+
+@pytest.mark.asyncio
+async def test_queue_limits_raise_queue_full():
+    settings.scheduler_max_queue_per_project = 1
+    scheduler = make_scheduler()
+    for _ in range(2):
+        scheduler.submit("llama3.2", 1)
+    scheduler.submit("llama3.2", 1)
+    with pytest.raises(QueueFull) as exc:
+        scheduler.submit("llama3.2", 1)
+    assert exc.value.scope == "project"
+    assert exc.value.retry_after >= 1
+
+
+@pytest.mark.asyncio
+async def test_released_queued_ticket_leaves_the_queue():
+    scheduler = make_scheduler()
+    running = [scheduler.submit("llama3.2", 1) for _ in range(2)]
+    queued = scheduler.submit("llama3.2", 1)
+    after = scheduler.submit("llama3.2", 2)
+    queued.release()
+    assert scheduler.stats()["queued_total"] == 1
+    running[0].release()
+    assert after.granted and not queued.granted
+
+
+@pytest.mark.asyncio
+async def test_background_never_refused_and_not_counted_in_queue_limits():
+    settings.scheduler_max_queue_total = 1
+    scheduler = make_scheduler()
+    background = [scheduler.submit("llama3.2", 1, background=True) for _ in range(50)]
+    assert sum(granted(background)) == 1
+    stats = scheduler.stats()
+    assert stats["queued_total"] == 0
+    assert stats["queued_background_by_model"] == {"llama3.2": 49}
+
+
+@pytest.mark.asyncio
+async def test_background_yields_to_interactive_work():
+    scheduler = make_scheduler()
+    batch = [scheduler.submit("llama3.2", 1, background=True) for _ in range(3)]
+    chat = [scheduler.submit("llama3.2", 2) for _ in range(2)]
+    # One slot for batch work, the other is left for chat
+    assert granted(batch) == [True, False, False]
+    assert granted(chat) == [True, False]
+
+    # A freed slot goes to waiting chat, not to queued batch work
+    batch[0].release()
+    assert chat[1].granted
+    assert not batch[1].granted
+    assert scheduler.position(batch[1]) == 1
+
+    chat[0].release()
+    assert batch[1].granted and not batch[2].granted
@@ -0,0 +1,100 @@
+"""SSEStream framing: token coalescing, heartbeats and producer shutdown."""
+import asyncio
+import json
+import pytest
+from app.utils.sse import HEARTBEAT, SSEStream
+
+
+async def events(*items, gap=0.0):
+    for item in items:
+        if isinstance(item, float):
+            await asyncio.sleep(item)
+            continue
+        yield item
+        if gap:
+            await asyncio.sleep(gap)
+
+
+def decode(frames):
+    return [
+        "heartbeat" if frame == HEARTBEAT else json.loads(frame[len(b"data: "):])
+        for frame in frames
+    ]
+
+
+async def frames(stream: SSEStream, source):
+    return decode([frame async for frame in stream.encode(source)])
+
+
+@pytest.mark.asyncio
+async def test_tokens_coalesced_until_next_event():
+    stream = SSEStream(coalesce_interval=10, coalesce_bytes=4096, heartbeat_interval=10)
+    sent = await frames(stream, events("a", "b", {"stage": "x"}, "c", "d"))
+    assert sent == [{"content": "ab"}, {"stage": "x"}, {"content": "cd"}]
+    assert stream.frames_sent == 3
+
+
+@pytest.mark.asyncio
+async def test_tokens_flushed_at_byte_threshold():
+    stream = SSEStream(coalesce_interval=10, coalesce_bytes=4, heartbeat_interval=10)
+    sent = await frames(stream, events("ab", "cd", "e", "fgh", "i"))
+    assert sent == [{"content": "abcd"}, {"content": "efgh"}, {"content": "i"}]
+
+
+@pytest.mark.asyncio
+async def test_tokens_flushed_when_coalesce_window_passes():
+    stream = SSEStream(coalesce_interval=0.02, coalesce_bytes=4096, heartbeat_interval=10)
+    sent = await frames(stream, events("a", "b", 0.1, "c"))
+    assert sent == [{"content": "ab"}, {"content": "c"}]
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_only_while_idle():
+    stream = SSEStream(coalesce_interval=0, coalesce_bytes=4096, heartbeat_interval=0.05)
+    busy = await frames(stream, events(*[{"n": i} for i in range(8)], gap=0.02))
+    assert "heartbeat" not in busy
+
+    stream = SSEStream(coalesce_interval=0, coalesce_bytes=4096, heartbeat_interval=0.05)
+    idle = await frames(stream, events({"n": 0}, 0.13, {"n": 1}))
+    assert idle[0] == {"n": 0} and idle[-1] == {"n": 1}
+    assert idle[1:-1] == ["heartbeat", "heartbeat"]
+
+
+@pytest.mark.asyncio
+async def test_token_frames_reset_heartbeat_timer():
+    stream = SSEStream(coalesce_interval=0, coalesce_bytes=4096, heartbeat_interval=0.05)
+    sent = await frames(stream, events(*"abcdefgh", {"done": True}, gap=0.02))
+    assert "heartbeat" not in sent
+    assert "".join(f["content"] for f in sent if "content" in f) == "abcdefgh"
+
+
+@pytest.mark.asyncio
+async def test_producer_error_raised_after_buffered_tokens():
+    async def failing():
+        yield "partial"
+        raise RuntimeError("upstream died")
+
+    stream = SSEStream(coalesce_interval=10, coalesce_bytes=4096, heartbeat_interval=10)
+    sent = []
+    with pytest.raises(RuntimeError, match="upstream died"):
+        async for frame in stream.encode(failing()):
+            sent.append(frame)
+    assert decode(sent) == [{"content": "partial"}]
+
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_producer():
+    closed = asyncio.Event()
+
+    async def endless():
+        try:
+            while True:
+                yield {"tick": True}
+                await asyncio.sleep(0.005)
+        finally:
+            closed.set()
+
+    encoder = SSEStream(coalesce_interval=0, coalesce_bytes=4096, heartbeat_interval=10).encode(endless())
+    assert decode([await encoder.__anext__()]) == [{"tick": True}]
+    await encoder.aclose()  # What Starlette does when the client goes away
+    await asyncio.wait_for(closed.wait(), 1)
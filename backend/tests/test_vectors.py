@@ -0,0 +1,142 @@
+"""ProjectIndex storage and search: exact scan, tombstones, compaction, IVF and model resets."""
+import numpy as np
+import pytest
+from app.config import settings
+from app.services.vectors import ProjectIndex, VectorStore
+
+DIM = 16
+
+
+@pytest.fixture(autouse=True)
+def vector_settings(monkeypatch):
+    monkeypatch.setattr(settings, "vector_ivf_threshold", 20000)
+    monkeypatch.setattr(settings, "vector_ivf_lists", 0)
+    monkeypatch.setattr(settings, "vector_ivf_nprobe", 8)
+    monkeypatch.setattr(settings, "vector_compact_ratio", 0.3)
+
+
+def random_vectors(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+
+def clustered_vectors(n, clusters=20, seed=0):
+    """Points around `clusters` centres, the shape real embeddings have."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, DIM))
+    points = centres[rng.integers(clusters, size=n)] + 0.15 * rng.standard_normal((n, DIM))
+    return points.astype(np.float32)
+
+
+def ids_of(results):
+    return [chunk_id for chunk_id, _ in results]
+
+
+def test_add_and_search_exact(tmp_path):
+    index = ProjectIndex(tmp_path)
+    vectors = random_vectors(50)
+    index.add(list(range(100, 150)), vectors, model="embed")
+
+    results = index.search(vectors[7], k=3, model="embed")
+    assert results[0][0] == 107
+    assert results[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert len(results) == 3
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+    with pytest.raises(ValueError):
+        index.add([1], random_vectors(1)[:, :8], model="embed")
+    with pytest.raises(ValueError):
+        index.add([1, 2], random_vectors(1), model="embed")
+
+
+def test_reopen_reads_committed_rows_only(tmp_path):
+    index = ProjectIndex(tmp_path)
+    vectors = random_vectors(10)
+    index.add(list(range(10)), vectors, model="embed")
+    # A torn append after a crash: bytes past the committed count are ignored
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(random_vectors(3).tobytes())
+
+    reopened = ProjectIndex(tmp_path)
+    assert reopened.stats() == {"model": "embed", "dim": DIM, "rows": 10, "live": 10, "ivf_lists": 0}
+    assert ids_of(reopened.search(vectors[4], k=1, model="embed")) == [4]
+    reopened.add([10], random_vectors(1, seed=1), model="embed")
+    assert ProjectIndex(tmp_path).count == 11
+
+
+def test_delete_tombstones_then_compacts(tmp_path):
+    index = ProjectIndex(tmp_path)
+    vectors = random_vectors(10)
+    index.add(list(range(10)), vectors, model="embed")
+
+    assert index.delete([3, 99]) == 1
+    assert index.delete([3]) == 0
+    assert index.count == 10 and index.live == 9  # Below the compaction ratio: tombstoned only
+    assert 3 not in ids_of(index.search(vectors[3], k=10, model="embed"))
+
+    assert index.delete([0, 1, 2]) == 3
+    assert index.count == 6 and index.live == 6  # Compacted
+    assert sorted(ids_of(index.search(vectors[5], k=10, model="embed"))) == [4, 5, 6, 7, 8, 9]
+    assert ProjectIndex(tmp_path).stats()["rows"] == 6
+
+
+def test_ivf_recall_close_to_exact_scan(tmp_path, monkeypatch):
+    vectors = clustered_vectors(3000)
+    ids = list(range(3000))
+    queries = clustered_vectors(50, seed=1)
+
+    exact = ProjectIndex(tmp_path / "exact")
+    exact.add(ids, vectors, model="embed")
+    assert exact.ivf is None
+
+    monkeypatch.setattr(settings, "vector_ivf_threshold", 1000)
+    approx = ProjectIndex(tmp_path / "ivf")
+    approx.add(ids, vectors, model="embed")
+    assert approx.ivf is not None
+    assert approx.stats()["ivf_lists"] == int(np.sqrt(3000))
+
+    k = 10
+    hits = sum(
+        len(set(ids_of(exact.search(q, k, model="embed"))) & set(ids_of(approx.search(q, k, model="embed"))))
+        for q in queries
+    )
+    assert hits / (k * len(queries)) >= 0.9
+
+    # Rows added since the build are scanned too, and the IVF survives a reopen
+    approx.add([5000], queries[0:1], model="embed")
+    assert ids_of(approx.search(queries[0], 1, model="embed")) == [5000]
+    reopened = ProjectIndex(tmp_path / "ivf")
+    assert reopened.ivf is not None
+    assert ids_of(reopened.search(queries[0], 1, model="embed")) == [5000]
+
+
+def test_model_mismatch_resets_index(tmp_path):
+    index = ProjectIndex(tmp_path)
+    old = random_vectors(5)
+    index.add(list(range(5)), old, model="old-embed")
+
+    # Queries from another model find nothing
+    assert index.search(old[0], k=5, model="new-embed") == []
+
+    # Vectors from another model (and dimension) replace the old ones
+    new = random_vectors(3, seed=1)[:, :8]
+    index.add([10, 11, 12], new, model="new-embed")
+    assert index.stats() == {"model": "new-embed", "dim": 8, "rows": 3, "live": 3, "ivf_lists": 0}
+    assert index.search(old[0], k=5, model="old-embed") == []
+    assert ids_of(index.search(new[1], k=1, model="new-embed")) == [11]
+    assert ProjectIndex(tmp_path).model == "new-embed"
+
+
+def test_store_keeps_projects_apart_and_drops_them(tmp_path):
+    store = VectorStore(tmp_path)
+    vectors = random_vectors(4)
+    store.add(1, [1, 2], vectors[:2], model="embed")
+    store.add(2, [3, 4], vectors[2:], model="embed")
+
+    assert ids_of(store.search(1, vectors[2], k=5, model="embed")) in ([1, 2], [2, 1])
+    assert store.has_vectors(2)
+    assert store.delete(2, [3]) == 1
+
+    store.drop(2)
+    assert not store.has_vectors(2)
+    assert not (tmp_path / "2").exists()
+    assert store.search(2, vectors[3], k=5, model="embed") == []
@@ -6,6 +6,9 @@ interface ConversationListProps {
   onSelectConversation: (id: number) => void;
   onNewConversation: () => void;
   onDeleteConversation?: (id: number) => void;
+  hasMore?: boolean;
+  loadingMore?: boolean;
+  onLoadMore?: () => void;
 }
 
 export const ConversationList: React.FC<ConversationListProps> = ({
@@ -14,12 +17,15 @@ export const ConversationList: React.FC<ConversationListProps> = ({
   onSelectConversation,
   onNewConversation,
   onDeleteConversation,
+  hasMore,
+  loadingMore,
+  onLoadMore,
 }) => {
   const getConversationPreview = (conversation: Conversation) => {
-    if (conversation.messages.length === 0) {
+    const firstMessage = conversation.first_message;
+    if (!firstMessage) {
       return "New conversation";
     }
-    const firstMessage = conversation.messages[0];
     return firstMessage.content.slice(0, 50) + (firstMessage.content.length > 50 ? "..." : "");
   };
 
@@ -83,7 +89,7 @@ export const ConversationList: React.FC<ConversationListProps> = ({
                       </span>
                       <span className="text-xs text-slate-600">•</span>
                       <span className="text-xs text-slate-500">
-                        {conversation.messages.length} msg{conversation.messages.length !== 1 ? 's' : ''}
+                        {conversation.message_count} msg{conversation.message_count !== 1 ? 's' : ''}
                       </span>
                     </div>
                   </div>
@@ -116,6 +122,17 @@ export const ConversationList: React.FC<ConversationListProps> = ({
                 </div>
               </div>
             ))}
+            {hasMore && onLoadMore && (
+              <div className="px-4 py-2">
+                <button
+                  onClick={onLoadMore}
+                  disabled={loadingMore}
+                  className="w-full px-4 py-2 text-sm bg-slate-700/30 hover:bg-slate-700 text-slate-400 hover:text-slate-200 rounded-lg transition-all disabled:opacity-50"
+                >
+                  {loadingMore ? "Loading..." : "Load more"}
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>
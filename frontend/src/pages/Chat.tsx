@@ -1,7 +1,7 @@
 import { useEffect, useRef, useState } from "react";
-import { useQuery } from "@tanstack/react-query";
+import { useInfiniteQuery, useQuery } from "@tanstack/react-query";
 import { useAppStore } from "../stores/useAppStore";
-import { projectsApi, agentsApi, chatApi } from "../services/api";
+import { projectsApi, agentsApi, chatApi, MESSAGE_PAGE_SIZE } from "../services/api";
 import { ChatMessage } from "../components/ChatMessage";
 import { ChatInput } from "../components/ChatInput";
 import { ConversationList } from "../components/ConversationList";
@@ -30,7 +30,10 @@ export const Chat: React.FC = () => {
   } = useAppStore();
 
   const [showConversations, setShowConversations] = useState(true);
+  const [hasEarlierMessages, setHasEarlierMessages] = useState(false);
+  const [loadingEarlier, setLoadingEarlier] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const keepScrollRef = useRef(false);
 
   // Fetch projects
   const { data: projects } = useQuery({
@@ -50,21 +53,27 @@ export const Chat: React.FC = () => {
     },
   });
 
-  // Fetch conversations for current project
-  const { data: conversationsData } = useQuery({
+  // Fetch conversations for current project, one cursor page at a time
+  const {
+    data: conversationsData,
+    fetchNextPage: fetchMoreConversations,
+    hasNextPage: hasMoreConversations,
+    isFetchingNextPage: loadingMoreConversations,
+  } = useInfiniteQuery({
     queryKey: ["conversations", currentProject?.id],
-    queryFn: async () => {
-      if (!currentProject) return [];
-      const response = await chatApi.getConversations(currentProject.id);
+    queryFn: async ({ pageParam }) => {
+      const response = await chatApi.getConversations(currentProject!.id, pageParam);
       return response.data;
     },
+    initialPageParam: undefined as string | undefined,
+    getNextPageParam: (lastPage) => lastPage.next_cursor ?? undefined,
     enabled: !!currentProject,
   });
 
   // Update conversations when data changes
   useEffect(() => {
     if (conversationsData) {
-      setConversations(conversationsData);
+      setConversations(conversationsData.pages.flatMap((page) => page.items));
     }
   }, [conversationsData, setConversations]);
 
@@ -81,26 +90,43 @@ export const Chat: React.FC = () => {
     }
   }, [agents, currentAgent, setCurrentAgent]);
 
-  // Load messages when conversation changes
+  // Load the newest page of messages when conversation changes
   useEffect(() => {
-    if (currentConversationId && conversations.length > 0) {
-      const conversation = conversations.find(c => c.id === currentConversationId);
-      if (conversation) {
-        setMessages(conversation.messages);
-      }
+    setHasEarlierMessages(false);
+    if (currentConversationId) {
+      chatApi.getMessages(currentConversationId).then((response) => {
+        setMessages(response.data);
+        setHasEarlierMessages(response.data.length === MESSAGE_PAGE_SIZE);
+      });
     }
-  }, [currentConversationId, conversations]);
+  }, [currentConversationId]);
 
-  // Scroll to bottom when messages change
+  // Scroll to bottom when messages change, unless earlier messages were prepended
   useEffect(() => {
+    if (keepScrollRef.current) {
+      keepScrollRef.current = false;
+      return;
+    }
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
   }, [messages, streamingMessage]);
 
+  const handleLoadEarlier = async () => {
+    if (!currentConversationId || messages.length === 0) return;
+    setLoadingEarlier(true);
+    try {
+      const response = await chatApi.getMessages(currentConversationId, messages[0].id);
+      keepScrollRef.current = true;
+      setMessages([...response.data, ...messages]);
+      setHasEarlierMessages(response.data.length === MESSAGE_PAGE_SIZE);
+    } finally {
+      setLoadingEarlier(false);
+    }
+  };
+
   const handleSelectConversation = (id: number) => {
     const conversation = conversations.find((c) => c.id === id);
     if (conversation) {
       setCurrentConversationId(id);
-      setMessages(conversation.messages);
       clearStreamingMessage();
     }
   };
@@ -187,6 +213,9 @@ export const Chat: React.FC = () => {
             currentConversationId={currentConversationId}
             onSelectConversation={handleSelectConversation}
             onNewConversation={handleNewConversation}
+            hasMore={hasMoreConversations}
+            loadingMore={loadingMoreConversations}
+            onLoadMore={() => fetchMoreConversations()}
           />
         </div>
       )}
@@ -271,6 +300,18 @@ export const Chat: React.FC = () => {
             </div>
           )}
 
+          {hasEarlierMessages && (
+            <div className="flex justify-center">
+              <button
+                onClick={handleLoadEarlier}
+                disabled={loadingEarlier}
+                className="px-4 py-1.5 text-sm bg-slate-700/30 hover:bg-slate-700 text-slate-400 hover:text-slate-200 rounded-lg transition-all disabled:opacity-50"
+              >
+                {loadingEarlier ? "Loading..." : "Load earlier messages"}
+              </button>
+            </div>
+          )}
+
           {messages.map((message) => (
             <ChatMessage key={message.id} message={message} />
           ))}
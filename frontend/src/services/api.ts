@@ -1,8 +1,10 @@
 import axios from "axios";
-import type { Project, Agent, Message, Conversation, ChatRequest } from "../types";
+import type { Project, Agent, Message, ConversationPage, ChatRequest } from "../types";
 
 const API_BASE_URL = "http://localhost:8000";
 
+export const MESSAGE_PAGE_SIZE = 100;
+
 const api = axios.create({
   baseURL: API_BASE_URL,
   headers: {
@@ -35,10 +37,15 @@ export const agentsApi = {
 
 // Chat
 export const chatApi = {
-  getConversations: (projectId: number) =>
-    api.get<Conversation[]>(`/api/chat/conversations/${projectId}`),
-  getMessages: (conversationId: number) =>
-    api.get<Message[]>(`/api/chat/messages/${conversationId}`),
+  getConversations: (projectId: number, cursor?: string) =>
+    api.get<ConversationPage>(`/api/chat/conversations/${projectId}`, {
+      params: cursor ? { cursor } : undefined,
+    }),
+  // Newest page by default; pass the oldest loaded id as `before` for earlier messages
+  getMessages: (conversationId: number, before?: number) =>
+    api.get<Message[]>(`/api/chat/messages/${conversationId}`, {
+      params: { limit: MESSAGE_PAGE_SIZE, ...(before !== undefined && { before }) },
+    }),
   sendMessage: (data: ChatRequest) => {
     // Return EventSource for streaming
     return new EventSource(
@@ -32,6 +32,7 @@ export interface Agent {
   max_tokens: number;
   created_at: string;
   updated_at: string;
+  residency?: 'warm' | 'loading' | 'cold';
 }
 
 export interface Message {
@@ -46,7 +47,16 @@ export interface Conversation {
   id: number;
   agent_id: number;
   created_at: string;
-  messages: Message[];
+  updated_at: string;
+  message_count: number;
+  first_message: Message | null;
+  last_message: Message | null;
+  messages?: Message[];
+}
+
+export interface ConversationPage {
+  items: Conversation[];
+  next_cursor: string | null;
 }
 
 export interface ChatRequest {